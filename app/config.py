@@ -8,12 +8,52 @@ class Settings:
     # Saptiva OPS API Configuration
     SAPTIVA_API_KEY: str = os.getenv("SAPTIVA_API_KEY", "")
     SAPTIVA_API_URL: str = os.getenv("SAPTIVA_API_URL", "https://api.saptiva.com/v1/chat")
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "30"))
+    # Connecting fails fast; reads wait for generation (defaults to LLM_TIMEOUT)
+    LLM_CONNECT_TIMEOUT: float = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+    LLM_READ_TIMEOUT: float = float(os.getenv("LLM_READ_TIMEOUT", os.getenv("LLM_TIMEOUT", "30")))
+    # Timeouts, connection errors, 429 and 5xx are retried with jittered
+    # exponential backoff, or after Retry-After when the provider sends one
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "2"))
+    LLM_BACKOFF_BASE: float = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+    LLM_BACKOFF_MAX: float = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+    # A longer Retry-After is not waited out; the call fails instead
+    LLM_RETRY_AFTER_MAX: float = float(os.getenv("LLM_RETRY_AFTER_MAX", "10"))
+    # The circuit opens when LLM_BREAKER_FAILURE_RATE of the last
+    # LLM_BREAKER_WINDOW attempts failed, and stays open LLM_BREAKER_COOLDOWN s
+    LLM_BREAKER_WINDOW: int = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+    LLM_BREAKER_MIN_CALLS: int = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+    LLM_BREAKER_FAILURE_RATE: float = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+    LLM_BREAKER_COOLDOWN: float = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+    LLM_HTTP2: bool = os.getenv("LLM_HTTP2", "true").lower() == "true"
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+    LLM_KEEPALIVE_EXPIRY: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+    # At most LLM_MAX_IN_FLIGHT calls run at once; up to LLM_MAX_QUEUE more
+    # wait by priority and are shed with a 503 past their queue deadline
+    LLM_MAX_IN_FLIGHT: int = int(os.getenv("LLM_MAX_IN_FLIGHT", "8"))
+    LLM_MAX_QUEUE: int = int(os.getenv("LLM_MAX_QUEUE", "32"))
+    LLM_QUEUE_TIMEOUT: float = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+    LLM_BATCH_QUEUE_TIMEOUT: float = float(os.getenv("LLM_BATCH_QUEUE_TIMEOUT", "60"))
     
     # Weaviate Configuration
     WEAVIATE_URL: str = os.getenv("WEAVIATE_URL", "http://weaviate:8080")
+    WEAVIATE_MAX_CONNECTIONS: int = int(os.getenv("WEAVIATE_MAX_CONNECTIONS", "20"))
+    WEAVIATE_PAGE_SIZE: int = int(os.getenv("WEAVIATE_PAGE_SIZE", "500"))
+    WEAVIATE_BATCH_SIZE: int = int(os.getenv("WEAVIATE_BATCH_SIZE", "100"))
+    WEAVIATE_BATCH_DYNAMIC: bool = os.getenv("WEAVIATE_BATCH_DYNAMIC", "true").lower() == "true"
+    WEAVIATE_BATCH_WORKERS: int = int(os.getenv("WEAVIATE_BATCH_WORKERS", "2"))
+    WEAVIATE_BATCH_RETRIES: int = int(os.getenv("WEAVIATE_BATCH_RETRIES", "3"))
     
     # Embedding Model
     EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+    EMBEDDING_BATCH_SIZE: int = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+    EMBEDDING_WORKERS: int = int(os.getenv("EMBEDDING_WORKERS", "2"))
+    EMBEDDING_BATCH_MAX_ITEMS: int = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "64"))
+    EMBEDDING_BATCH_WAIT_MS: float = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
+    EMBEDDING_CACHE_MAX_BYTES: int = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    EMBEDDING_STORE_ENABLED: bool = os.getenv("EMBEDDING_STORE_ENABLED", "true").lower() == "true"
+    EMBEDDING_STORE_DIR: str = os.getenv("EMBEDDING_STORE_DIR", "data/embeddings")
     
     # Application Settings
     APP_NAME: str = os.getenv("APP_NAME", "MediCopilot")
@@ -22,11 +62,76 @@ class Settings:
     # File Upload Settings
     MAX_FILE_SIZE: int = 10 * 1024 * 1024  # 10MB
     ALLOWED_EXTENSIONS: set = {".pdf", ".txt", ".docx"}
+    UPLOAD_DIR: str = os.getenv("UPLOAD_DIR", "data/uploads")
+    ARCHIVE_EXTENSIONS: set = {".zip", ".tar", ".tgz", ".gz"}
+    BULK_MAX_FILES: int = int(os.getenv("BULK_MAX_FILES", "1000"))
+    BULK_MAX_ARCHIVE_SIZE: int = int(os.getenv("BULK_MAX_ARCHIVE_SIZE", str(200 * 1024 * 1024)))
+    # Caps on what one archive may expand to, checked while its members are copied out
+    BULK_MAX_EXTRACTED_SIZE: int = int(os.getenv("BULK_MAX_EXTRACTED_SIZE", str(1024 * 1024 * 1024)))
+    ARCHIVE_MAX_COMPRESSION_RATIO: float = float(os.getenv("ARCHIVE_MAX_COMPRESSION_RATIO", "100"))
+    STREAM_BLOCK_SIZE: int = int(os.getenv("STREAM_BLOCK_SIZE", str(64 * 1024)))
+    
+    # Ingestion Job Settings
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", "2"))
+    INGEST_QUEUE_SIZE: int = int(os.getenv("INGEST_QUEUE_SIZE", "32"))
+    INGEST_STORE_BATCH_SIZE: int = int(os.getenv("INGEST_STORE_BATCH_SIZE", "100"))
+    # Chunks embedded, written and released at a time; bounds a job's vectors in memory
+    INGEST_EMBED_WINDOW: int = int(os.getenv("INGEST_EMBED_WINDOW", "1000"))
+    INGEST_EXTRACT_CONCURRENCY: int = int(os.getenv("INGEST_EXTRACT_CONCURRENCY", "4"))
+    INGEST_JOB_HISTORY: int = int(os.getenv("INGEST_JOB_HISTORY", "500"))
+    # Job records shared by all workers, so any of them can report progress
+    INGEST_JOB_DIR: str = os.getenv("INGEST_JOB_DIR", "data/jobs")
+    # Progress is written to the job record at most this often; status changes always are
+    INGEST_JOB_SAVE_INTERVAL: float = float(os.getenv("INGEST_JOB_SAVE_INTERVAL", "1.0"))
+    
+    # Text Extraction Settings
+    EXTRACTION_WORKERS: int = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 2)))
+    PDF_PAGES_PER_SHARD: int = int(os.getenv("PDF_PAGES_PER_SHARD", "25"))
     
     # RAG Settings
     CHUNK_SIZE: int = 1000
     CHUNK_OVERLAP: int = 200
+    # "chars" packs CHUNK_SIZE characters; "tokens" packs up to the embedding
+    # model's max sequence length (or CHUNK_TOKENS) in model tokens
+    CHUNKING_MODE: str = os.getenv("CHUNKING_MODE", "chars").lower()
+    CHUNK_TOKENS: int = int(os.getenv("CHUNK_TOKENS", "0"))
+    CHUNK_OVERLAP_TOKENS: int = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+    TOKENIZE_BATCH_SIZE: int = int(os.getenv("TOKENIZE_BATCH_SIZE", "256"))
     MAX_RETRIEVAL_RESULTS: int = 5
+    # Retrieval: "vector", "hybrid" (Weaviate BM25 + vector), "keyword" (BM25)
+    # or "rrf" (client-side reciprocal-rank fusion of vector and BM25)
+    SEARCH_MODE: str = os.getenv("SEARCH_MODE", "vector").lower()
+    HYBRID_ALPHA: float = float(os.getenv("HYBRID_ALPHA", "0.5"))
+    # Chunks less similar than this (1 - cosine distance) never reach the prompt
+    MIN_SIMILARITY: float = float(os.getenv("MIN_SIMILARITY", "0.0"))
+    RRF_K: int = int(os.getenv("RRF_K", "60"))
+    RRF_CANDIDATE_MULTIPLIER: int = int(os.getenv("RRF_CANDIDATE_MULTIPLIER", "3"))
+    # Near-duplicate chunks (word-shingle Jaccard >= DEDUP_SIMILARITY) are
+    # dropped from results; retrieval over-fetches to keep max_results
+    DEDUP_ENABLED: bool = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+    DEDUP_SIMILARITY: float = float(os.getenv("DEDUP_SIMILARITY", "0.8"))
+    DEDUP_CANDIDATE_MULTIPLIER: int = int(os.getenv("DEDUP_CANDIDATE_MULTIPLIER", "2"))
+    # Prompt context is packed by relevance up to this many tokens (0 = no limit)
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+    # Queries retrieving at once; LLM calls are bounded by the dispatcher below
+    MAX_CONCURRENT_QUERIES: int = int(os.getenv("MAX_CONCURRENT_QUERIES", "16"))
+    
+    # Answer Cache Settings
+    ANSWER_CACHE_ENABLED: bool = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+    ANSWER_CACHE_MAX_ENTRIES: int = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+    ANSWER_CACHE_TTL: float = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+    ANSWER_CACHE_SIMILARITY: float = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+    # Corpus write counter shared by all workers; cached answers older than it are dropped
+    CORPUS_VERSION_PATH: str = os.getenv("CORPUS_VERSION_PATH", "data/corpus_version")
+    
+    # Health Check Settings
+    # Dependencies are probed in the background; /health serves the last result
+    HEALTH_CHECK_INTERVAL: float = float(os.getenv("HEALTH_CHECK_INTERVAL", "15"))
+    HEALTH_CHECK_TIMEOUT: float = float(os.getenv("HEALTH_CHECK_TIMEOUT", "3"))
+    # Results older than this many intervals count as failed (refresher stuck)
+    HEALTH_STALE_INTERVALS: int = int(os.getenv("HEALTH_STALE_INTERVALS", "3"))
+    # /health/deep runs a real one-token LLM completion; off unless enabled
+    HEALTH_DEEP_CHECK_ENABLED: bool = os.getenv("HEALTH_DEEP_CHECK_ENABLED", "false").lower() == "true"
 
 settings = Settings()
 
@@ -1,24 +1,46 @@
 import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from datetime import datetime
 from app.config import settings
 from app.models import HealthResponse, ErrorResponse
 from app.routers import documents, query
 from app.services.vectorstore import vectorstore
 from app.services.llm import llm_client
+from app.services.embeddings import embedding_service
+from app.services.jobs import ingestion_jobs
+from app.services.ingest import document_processor
+from app.services.health import health_monitor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Manage shared clients and executors for the app lifetime"""
+    await llm_client.start()
+    await ingestion_jobs.start()
+    await health_monitor.start()
+    yield
+    await health_monitor.stop()
+    await ingestion_jobs.stop()
+    await llm_client.close()
+    await vectorstore.close()
+    document_processor.shutdown()
+    embedding_service.shutdown()
+
 # Create FastAPI app
 app = FastAPI(
     title=settings.APP_NAME,
     version=settings.APP_VERSION,
     description="Asistente médico de nueva generación con RAG",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -44,39 +66,50 @@ async def root():
         "endpoints": {
             "docs": "/docs",
             "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
             "upload": "/documents/upload",
-            "query": "/query/"
+            "ingestion_job": "/documents/jobs/{job_id}",
+            "query": "/query/",
+            "query_stream": "/query/stream"
         }
     }
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint"""
-    try:
-        # Check Weaviate connection
-        weaviate_status = "ok" if vectorstore.client.is_ready() else "error"
-        
-        # Check LLM connection
-        llm_status = "ok" if llm_client.test_connection() else "error"
-        
-        # Overall status
-        overall_status = "healthy" if weaviate_status == "ok" and llm_status == "ok" else "unhealthy"
-        
-        return HealthResponse(
-            status=overall_status,
-            weaviate_status=weaviate_status,
-            api_status="ok",
-            timestamp=datetime.now()
-        )
-        
-    except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        return HealthResponse(
-            status="unhealthy",
-            weaviate_status="error",
-            api_status="error",
-            timestamp=datetime.now()
+    """Health check endpoint; serves the last background probe results"""
+    snapshot = health_monitor.snapshot()
+    checks = snapshot["checks"]
+    return HealthResponse(
+        status=snapshot["status"],
+        weaviate_status=checks.get("weaviate", {}).get("status", "unknown"),
+        llm_status=checks.get("llm", {}).get("status", "unknown"),
+        api_status="ok",
+        timestamp=snapshot["timestamp"],
+        checks=checks
+    )
+
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive", "timestamp": datetime.now()}
+
+@app.get("/health/ready")
+async def readiness():
+    """Readiness probe: 503 while the vector store is down or unchecked"""
+    snapshot = health_monitor.snapshot()
+    status_code = status.HTTP_200_OK if health_monitor.is_ready() else status.HTTP_503_SERVICE_UNAVAILABLE
+    return JSONResponse(status_code=status_code, content=jsonable_encoder(snapshot))
+
+@app.get("/health/deep")
+async def deep_health_check():
+    """Opt-in check that runs a one-token LLM completion"""
+    if not settings.HEALTH_DEEP_CHECK_ENABLED:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Deep health check is disabled (HEALTH_DEEP_CHECK_ENABLED)"
         )
+    return await health_monitor.deep_check()
 
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
@@ -1,28 +1,64 @@
-from pydantic import BaseModel
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime
 
-class DocumentUploadResponse(BaseModel):
-    document_id: str
-    filename: str
-    chunks_created: int
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    document_id: Optional[str] = None
+    filename: Optional[str] = None
+    status: str
+    documents: List[Dict[str, Any]] = []
     message: str
 
+class IngestionJobStatus(BaseModel):
+    job_id: str
+    document_id: Optional[str] = None
+    filename: Optional[str] = None
+    status: str
+    documents_total: int
+    documents_failed: int
+    pages_extracted: int
+    chunks_total: int
+    chunks_truncated: int = 0
+    tokens_truncated: int = 0
+    chunks_cached: int = 0
+    chunks_embedded: int
+    chunks_stored: int
+    chunks_failed: int = 0
+    write_objects_per_second: float = 0.0
+    write_bytes_per_second: float = 0.0
+    chunks_unchanged: int = 0
+    chunks_deleted: int = 0
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    documents: List[Dict[str, Any]]
+
 class QueryRequest(BaseModel):
     question: str
     max_results: Optional[int] = 5
+    search_mode: Optional[Literal["vector", "hybrid", "keyword", "rrf"]] = None
+    alpha: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    min_similarity: Optional[float] = Field(default=None, ge=0.0, le=1.0)
+    # "batch" (evaluations, bulk jobs) yields LLM slots to interactive users
+    priority: Literal["interactive", "batch"] = "interactive"
 
 class QueryResponse(BaseModel):
     answer: str
     sources: List[Dict[str, Any]]
     query: str
     timestamp: datetime
+    context_tokens: Optional[int] = None
+    # True when the LLM was unavailable and only sources are returned
+    degraded: bool = False
 
 class HealthResponse(BaseModel):
     status: str
     weaviate_status: str
+    llm_status: str = "unknown"
     api_status: str
     timestamp: datetime
+    checks: Dict[str, Any] = {}
 
 class DocumentChunk(BaseModel):
     content: str
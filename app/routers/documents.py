@@ -1,90 +1,179 @@
 import os
-import shutil
 import logging
-from fastapi import APIRouter, UploadFile, File, HTTPException, status
+from typing import List, Tuple, Optional
+from fastapi import APIRouter, Request, Query, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import JSONResponse
 from datetime import datetime
-from app.models import DocumentUploadResponse, ErrorResponse
+from app.models import IngestionJobResponse, IngestionJobStatus, ErrorResponse
 from app.services.ingest import document_processor
+from app.services.jobs import ingestion_jobs, IngestionQueueFull
 from app.services.vectorstore import vectorstore
+from app.services.uploads import MultipartStream, UploadTooLarge, InvalidMultipart, multipart_files_body
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/documents", tags=["documents"])
 
-@router.post("/upload", response_model=DocumentUploadResponse)
-async def upload_document(file: UploadFile = File(...)):
-    """Upload and process a medical document"""
+@router.post("/upload", response_model=IngestionJobResponse, status_code=status.HTTP_202_ACCEPTED,
+             openapi_extra=multipart_files_body("file"))
+async def upload_document(request: Request, document_key: Optional[str] = Query(None, min_length=1)):
+    """Upload a medical document and queue it for background processing
     
-    # Validate file type
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    if file_ext not in settings.ALLOWED_EXTENSIONS:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"File type {file_ext} not supported. Allowed types: {', '.join(settings.ALLOWED_EXTENSIONS)}"
-        )
-    
-    # Validate file size
-    if file.size > settings.MAX_FILE_SIZE:
+    Uploads with the same ``document_key`` (default: the filename) update one document.
+    The file is written to disk as it arrives and rejected once it passes MAX_FILE_SIZE.
+    """
+    file_path = None
+    filename = None
+    try:
+        async for part in MultipartStream(request).parts():
+            if part.name != "file" or not part.filename:
+                continue
+            
+            # Validate file type
+            filename = part.filename
+            file_ext = os.path.splitext(filename)[1].lower()
+            if file_ext not in settings.ALLOWED_EXTENSIONS:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"File type {file_ext} not supported. Allowed types: {', '.join(settings.ALLOWED_EXTENSIONS)}"
+                )
+            
+            file_path = await part.save(file_ext, settings.MAX_FILE_SIZE)
+            break
+        
+        if file_path is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No file uploaded")
+        
+        job = ingestion_jobs.submit(file_path, filename, document_key)
+    except HTTPException:
+        raise
+    except UploadTooLarge:
         raise HTTPException(
             status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
             detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE / (1024*1024):.1f}MB"
         )
+    except InvalidMultipart as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except IngestionQueueFull as e:
+        os.remove(file_path)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "5"}
+        )
+    except Exception as e:
+        logger.error(f"Error queueing document {filename}: {e}")
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error queueing document: {str(e)}"
+        )
+    
+    logger.info(f"Queued document {filename} as job {job['job_id']}")
+    
+    return IngestionJobResponse(
+        job_id=job["job_id"],
+        document_id=job["document_id"],
+        filename=filename,
+        status=job["status"],
+        message=f"Document '{filename}' queued for processing"
+    )
+
+@router.post("/bulk", response_model=IngestionJobResponse, status_code=status.HTTP_202_ACCEPTED,
+             openapi_extra=multipart_files_body("files", many=True))
+async def upload_documents_bulk(request: Request):
+    """Upload many documents (or zip/tar archives of documents) as one ingestion job"""
+    
+    saved: List[Tuple[str, str]] = []
+    skipped: List[str] = []
     
     try:
-        # Create data directory if it doesn't exist
-        os.makedirs("data", exist_ok=True)
-        
-        # Save uploaded file
-        file_path = f"data/{file.filename}"
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        logger.info(f"Uploaded file: {file.filename}")
-        
-        # Process the document
-        result = document_processor.process_document(file_path, file.filename)
-        
-        # Store chunks in vector database
-        success = vectorstore.add_documents(result["chunks"])
+        async for part in MultipartStream(request).parts():
+            if part.name != "files" or not part.filename:
+                continue
+            file_ext = os.path.splitext(part.filename)[1].lower()
+            
+            if file_ext in settings.ALLOWED_EXTENSIONS:
+                try:
+                    file_path = await part.save(file_ext, settings.MAX_FILE_SIZE)
+                except UploadTooLarge:
+                    # The rest of the part is skipped when the next one is read
+                    skipped.append(part.filename)
+                    continue
+                saved.append((file_path, part.filename))
+            elif file_ext in settings.ARCHIVE_EXTENSIONS:
+                try:
+                    archive_path = await part.save(".archive", settings.BULK_MAX_ARCHIVE_SIZE)
+                except UploadTooLarge:
+                    skipped.append(part.filename)
+                    continue
+                saved.extend(await run_in_threadpool(_expand_archive_upload, archive_path, part.filename))
+            else:
+                skipped.append(part.filename)
+            
+            if len(saved) > settings.BULK_MAX_FILES:
+                raise ValueError(f"Too many documents. Maximum per request: {settings.BULK_MAX_FILES}")
         
-        if not success:
-            # Clean up uploaded file if storage failed
-            os.remove(file_path)
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to store document in vector database"
-            )
-        
-        # Clean up uploaded file (optional - you might want to keep it)
-        os.remove(file_path)
+        if not saved:
+            raise ValueError(f"No supported documents found. Allowed types: {', '.join(settings.ALLOWED_EXTENSIONS)}")
         
-        logger.info(f"Successfully processed document: {file.filename}")
-        
-        return DocumentUploadResponse(
-            document_id=result["document_id"],
-            filename=file.filename,
-            chunks_created=result["total_chunks"],
-            message=f"Document '{file.filename}' processed successfully with {result['total_chunks']} chunks"
+        job = ingestion_jobs.submit_bulk(saved)
+    except (ValueError, IngestionQueueFull) as e:
+        # InvalidMultipart is a ValueError too
+        _remove_files(saved)
+        is_full = isinstance(e, IngestionQueueFull)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS if is_full else status.HTTP_400_BAD_REQUEST,
+            detail=str(e),
+            headers={"Retry-After": "5"} if is_full else None
         )
-        
-    except HTTPException:
-        raise
     except Exception as e:
-        logger.error(f"Error processing document {file.filename}: {e}")
-        
-        # Clean up file if it exists
-        file_path = f"data/{file.filename}"
+        logger.error(f"Error queueing bulk upload: {e}")
+        _remove_files(saved)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error queueing documents: {str(e)}"
+        )
+    
+    logger.info(f"Queued {len(saved)} documents as bulk job {job['job_id']}")
+    
+    message = f"{len(saved)} documents queued for processing"
+    if skipped:
+        message += f"; skipped {len(skipped)} unsupported or oversized files: {', '.join(skipped)}"
+    
+    return IngestionJobResponse(
+        job_id=job["job_id"],
+        status=job["status"],
+        documents=job["documents"],
+        message=message
+    )
+
+def _expand_archive_upload(archive_path: str, archive_name: str) -> List[Tuple[str, str]]:
+    try:
+        return document_processor.expand_archive(archive_path, archive_name, settings.UPLOAD_DIR)
+    finally:
+        os.remove(archive_path)
+
+def _remove_files(files: List[Tuple[str, str]]):
+    for file_path, _ in files:
         if os.path.exists(file_path):
             os.remove(file_path)
-        
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobStatus)
+async def get_ingestion_job(job_id: str):
+    """Get the progress of a document ingestion job"""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error processing document: {str(e)}"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job {job_id} not found"
         )
+    return job
 
 @router.get("/{document_id}/summary")
-async def get_document_summary(document_id: str):
+def get_document_summary(document_id: str):
     """Get summary information about a document"""
     try:
         from app.services.rag import rag_pipeline
@@ -98,13 +187,16 @@ async def get_document_summary(document_id: str):
         )
 
 @router.delete("/{document_id}")
-async def delete_document(document_id: str):
+def delete_document(document_id: str):
     """Delete a document and all its chunks"""
     try:
-        success = vectorstore.delete_document(document_id)
+        deleted = vectorstore.delete_document(document_id)
         
-        if success:
-            return {"message": f"Document {document_id} deleted successfully"}
+        if deleted is not None:
+            return {
+                "message": f"Document {document_id} deleted successfully",
+                "chunks_deleted": deleted
+            }
         else:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -120,11 +212,11 @@ async def delete_document(document_id: str):
         )
 
 @router.get("/stats")
-async def get_document_stats():
+def get_document_stats():
     """Get statistics about stored documents"""
     try:
         stats = vectorstore.get_stats()
-        return stats
+        return {**stats, "ingestion": ingestion_jobs.stats(), "writes": vectorstore.write_stats()}
     except Exception as e:
         logger.error(f"Error getting document stats: {e}")
         raise HTTPException(
@@ -1,12 +1,36 @@
+import json
 import logging
+from contextlib import aclosing
+import anyio
 from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import StreamingResponse
+from starlette.types import Send
 from datetime import datetime
 from app.models import QueryRequest, QueryResponse, ErrorResponse
 from app.services.rag import rag_pipeline
+from app.services.health import health_monitor
+from app.services.dispatch import llm_dispatcher, LLMOverloaded
+from app.services.llm import llm_client
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/query", tags=["query"])
 
+class ClosingStreamingResponse(StreamingResponse):
+    """StreamingResponse that closes its body generator however the response ends
+    
+    When the client disconnects, Starlette cancels the sending task and leaves
+    the generator suspended, holding whatever it holds (here, an LLM call slot)
+    until garbage collection. Closing it in the same task, shielded from that
+    cancellation, releases it right away.
+    """
+    
+    async def stream_response(self, send: Send) -> None:
+        try:
+            await super().stream_response(send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+
 @router.post("/", response_model=QueryResponse)
 async def query_documents(request: QueryRequest):
     """Query the medical documents using RAG"""
@@ -19,9 +43,13 @@ async def query_documents(request: QueryRequest):
     
     try:
         # Process the query through RAG pipeline
-        result = rag_pipeline.query(
+        result = await rag_pipeline.query(
             question=request.question,
-            max_results=request.max_results or 5
+            max_results=request.max_results or 5,
+            search_mode=request.search_mode,
+            alpha=request.alpha,
+            min_similarity=request.min_similarity,
+            priority=request.priority
         )
         
         logger.info(f"Processed query: {request.question[:50]}...")
@@ -30,9 +58,17 @@ async def query_documents(request: QueryRequest):
             answer=result["answer"],
             sources=result["sources"],
             query=result["query"],
-            timestamp=datetime.now()
+            timestamp=datetime.now(),
+            context_tokens=result.get("context_tokens"),
+            degraded=result.get("degraded", False)
         )
         
+    except LLMOverloaded as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"LLM overloaded: {e}",
+            headers={"Retry-After": str(e.retry_after)}
+        )
     except Exception as e:
         logger.error(f"Error processing query: {e}")
         raise HTTPException(
@@ -40,29 +76,60 @@ async def query_documents(request: QueryRequest):
             detail=f"Error processing query: {str(e)}"
         )
 
-@router.get("/health")
-async def query_health():
-    """Check if the query service is healthy"""
-    try:
-        # Test LLM connection
-        from app.services.llm import llm_client
-        llm_healthy = llm_client.test_connection()
-        
-        # Test vector store
-        from app.services.vectorstore import vectorstore
-        vectorstore_healthy = vectorstore.client.is_ready()
+@router.post("/stream")
+async def query_documents_stream(request: QueryRequest):
+    """Query the medical documents and stream the answer as Server-Sent Events"""
+    
+    if not request.question.strip():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Question cannot be empty"
+        )
+    
+    async def event_stream():
+        events = rag_pipeline.query_stream(
+            question=request.question,
+            max_results=request.max_results or 5,
+            search_mode=request.search_mode,
+            alpha=request.alpha,
+            min_similarity=request.min_similarity,
+            priority=request.priority
+        )
+        async with aclosing(events):
+            async for event in events:
+                data = json.dumps(event["data"], ensure_ascii=False, default=str)
+                yield f"event: {event['event']}\ndata: {data}\n\n"
         
-        return {
-            "status": "healthy" if llm_healthy and vectorstore_healthy else "unhealthy",
-            "llm_connection": "ok" if llm_healthy else "error",
-            "vectorstore_connection": "ok" if vectorstore_healthy else "error",
-            "timestamp": datetime.now()
-        }
-    except Exception as e:
-        logger.error(f"Health check failed: {e}")
-        return {
-            "status": "unhealthy",
-            "error": str(e),
-            "timestamp": datetime.now()
+        logger.info(f"Streamed query: {request.question[:50]}...")
+    
+    return ClosingStreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
         }
+    )
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    """Get answer and embedding cache hit/miss statistics"""
+    return rag_pipeline.cache_stats()
+
+@router.get("/llm/stats")
+async def get_llm_stats():
+    """Get LLM call concurrency, queue, shedding and circuit breaker statistics"""
+    return {**llm_dispatcher.stats(), "circuit": llm_client.breaker.stats()}
+
+@router.get("/health")
+async def query_health():
+    """Check if the query service is healthy from the cached probe results"""
+    snapshot = health_monitor.snapshot()
+    checks = snapshot["checks"]
+    return {
+        "status": snapshot["status"],
+        "llm_connection": checks.get("llm", {}).get("status", "unknown"),
+        "vectorstore_connection": checks.get("weaviate", {}).get("status", "unknown"),
+        "timestamp": snapshot["timestamp"]
+    }
 
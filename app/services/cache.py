@@ -0,0 +1,167 @@
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import numpy as np
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = "¿?¡!.,;: "
+
+def normalize_text(text: str) -> str:
+    """Normalize text for cache keys: case, whitespace and edge punctuation"""
+    text = _WHITESPACE.sub(" ", text.casefold())
+    return text.strip(_EDGE_PUNCTUATION)
+
+class AnswerCache:
+    """Exact and semantic cache of RAG answers with TTL and LRU eviction"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float, similarity_threshold: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._corpus_version = 0
+        # Stacked embeddings of live entries, rebuilt lazily after mutations
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_keys: List[str] = []
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_exact(self, question: str, variant: str, corpus_version: int) -> Optional[Dict[str, Any]]:
+        """Look up an answer by normalized question text"""
+        with self._lock:
+            if not self._sync_version(corpus_version):
+                return None
+            key = self._key(question, variant)
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                if entry is not None:
+                    self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry["result"]
+
+    def get_semantic(self, embedding: List[float], variant: str, corpus_version: int) -> Optional[Dict[str, Any]]:
+        """Look up an answer whose question embedding is close enough to this one"""
+        with self._lock:
+            if not self._sync_version(corpus_version):
+                self.misses += 1
+                return None
+            self._evict_expired()
+
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[k]["embedding"] for k in self._matrix_keys])
+
+            similarities = self._matrix @ self._unit(embedding)
+            for idx in np.argsort(-similarities):
+                if similarities[idx] < self.similarity_threshold:
+                    break
+                key = self._matrix_keys[idx]
+                entry = self._entries[key]
+                if entry["variant"] != variant:
+                    continue
+
+                self._entries.move_to_end(key)
+                self.semantic_hits += 1
+                return entry["result"]
+
+            self.misses += 1
+            return None
+
+    def put(self, question: str, embedding: List[float], variant: str, result: Dict[str, Any], corpus_version: int):
+        """Store an answer for a question"""
+        with self._lock:
+            if not self._sync_version(corpus_version):
+                # The corpus changed while this answer was being generated
+                return
+            key = self._key(question, variant)
+            self._entries[key] = {
+                "embedding": self._unit(embedding),
+                "variant": variant,
+                "result": result,
+                "expires_at": time.monotonic() + self.ttl_seconds
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        """Drop every cached answer"""
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+                "invalidations": self.invalidations
+            }
+
+    def _sync_version(self, corpus_version: int) -> bool:
+        # Any write to the corpus makes every cached answer suspect; a caller
+        # holding an older version than the cache has seen is itself stale
+        if corpus_version < self._corpus_version:
+            return False
+        if corpus_version > self._corpus_version:
+            self._corpus_version = corpus_version
+            self._clear()
+        return True
+
+    def _clear(self):
+        if self._entries:
+            logger.info(f"Invalidating {len(self._entries)} cached answers")
+        self._entries.clear()
+        self._matrix = None
+        self.invalidations += 1
+
+    def _evict_expired(self):
+        expired = [k for k, entry in self._entries.items() if self._expired(entry)]
+        for key in expired:
+            self._remove(key)
+
+    def _remove(self, key: str):
+        del self._entries[key]
+        self._matrix = None
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return entry["expires_at"] <= time.monotonic()
+
+    @staticmethod
+    def _key(question: str, variant: str) -> str:
+        return f"{variant}|{normalize_text(question)}"
+
+    @staticmethod
+    def _unit(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+# Global instance
+answer_cache = AnswerCache(
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL,
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY
+)
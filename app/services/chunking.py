@@ -0,0 +1,137 @@
+"""Sentence splitting and chunk packing for document ingestion.
+
+Everything here is a generator: text is scanned once with a precompiled
+pattern and chunks are yielded as soon as they are full, so work and memory
+grow with the chunk size rather than the document size. Chunks are
+measured in characters, or in embedding-model tokens for token mode.
+"""
+import re
+import hashlib
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, Iterable, Iterator, List, Tuple
+
+# Simple sentence splitting - can be improved with more sophisticated NLP
+_SENTENCE_END = re.compile(r"[.!?]+")
+_WORD = re.compile(r"\S+")
+_WHITESPACE = re.compile(r"\s+")
+
+TokenCounter = Callable[[List[str]], List[int]]
+
+def iter_sentences(text: str) -> Iterator[str]:
+    """Yield the non-empty sentences of a text"""
+    return iter_block_sentences((text,))
+
+def iter_block_sentences(blocks: Iterable[str]) -> Iterator[str]:
+    """Yield the non-empty sentences of text that arrives in blocks
+
+    A sentence may span any number of blocks; only its pieces are held.
+    """
+    pending: List[str] = []
+    for block in blocks:
+        start = 0
+        for match in _SENTENCE_END.finditer(block):
+            pending.append(block[start:match.start()])
+            sentence = "".join(pending).strip()
+            pending = []
+            if sentence:
+                yield sentence
+            start = match.end()
+        pending.append(block[start:])
+
+    sentence = "".join(pending).strip()
+    if sentence:
+        yield sentence
+
+def iter_chunks(sentences: Iterable[str], chunk_size: int, chunk_overlap: int) -> Iterator[str]:
+    """Pack sentences into chunks of about ``chunk_size`` characters
+
+    A chunk is closed when the next sentence would push it past
+    ``chunk_size``; the next chunk starts with the last ``chunk_overlap``
+    characters of the previous one.
+    """
+    parts: List[str] = []
+    length = 0
+
+    for sentence in sentences:
+        if parts and length + len(sentence) > chunk_size:
+            chunk = "".join(parts)
+            yield chunk.strip()
+
+            # Start new chunk with overlap
+            overlap = overlap_text(chunk, chunk_overlap)
+            parts = [overlap, " ", sentence]
+            length = len(overlap) + 1 + len(sentence)
+        else:
+            if parts:
+                parts.append(" ")
+                length += 1
+            parts.append(sentence)
+            length += len(sentence)
+
+    chunk = "".join(parts).strip()
+    if chunk:
+        yield chunk
+
+def content_hash(text: str, model_name: str) -> str:
+    """Hash of whitespace-normalized text and the model that embeds it"""
+    normalized = _WHITESPACE.sub(" ", text).strip()
+    return hashlib.sha256(f"{model_name}\n{normalized}".encode("utf-8")).hexdigest()
+
+def overlap_text(text: str, overlap_size: int) -> str:
+    """Get the last part of text for overlap"""
+    if len(text) <= overlap_size:
+        return text
+    return text[-overlap_size:].strip()
+
+def iter_token_chunks(sentences: Iterable[str], count_tokens: TokenCounter, max_tokens: int,
+                      overlap_tokens: int, batch_size: int = 256) -> Iterator[Tuple[str, int]]:
+    """Pack sentences into chunks of at most ``max_tokens`` model tokens
+
+    Yields (chunk, tokens). Whole trailing sentences worth up to
+    ``overlap_tokens`` are carried into the next chunk, and sentences longer
+    than ``max_tokens`` are split on word boundaries. Token counts of
+    sentences are summed, which is exact for WordPiece-style tokenizers
+    since sentences are joined with a space.
+    """
+    window: Deque[Tuple[str, int]] = deque()
+    total = 0
+
+    for piece, tokens in _iter_token_pieces(sentences, count_tokens, max_tokens, batch_size):
+        if window and total + tokens > max_tokens:
+            yield " ".join(text for text, _ in window), total
+
+            # Keep the tail that fits the overlap budget and leaves room for this piece
+            while window and (total > overlap_tokens or total + tokens > max_tokens):
+                total -= window.popleft()[1]
+        window.append((piece, tokens))
+        total += tokens
+
+    if window:
+        yield " ".join(text for text, _ in window), total
+
+def with_token_counts(texts: Iterable[str], count_tokens: TokenCounter,
+                      batch_size: int = 256) -> Iterator[Tuple[str, int]]:
+    """Pair texts with their token counts, tokenizing in batches"""
+    texts = iter(texts)
+    while batch := list(islice(texts, batch_size)):
+        yield from zip(batch, count_tokens(batch))
+
+def _iter_token_pieces(sentences: Iterable[str], count_tokens: TokenCounter, max_tokens: int,
+                       batch_size: int) -> Iterator[Tuple[str, int]]:
+    for sentence, tokens in with_token_counts(sentences, count_tokens, batch_size):
+        if tokens <= max_tokens:
+            yield sentence, tokens
+            continue
+
+        # Rare: a single sentence longer than the model window
+        words: List[str] = []
+        total = 0
+        for word, word_tokens in with_token_counts(_WORD.findall(sentence), count_tokens, batch_size):
+            if words and total + word_tokens > max_tokens:
+                yield " ".join(words), total
+                words, total = [], 0
+            words.append(word)
+            total += word_tokens
+        if words:
+            yield " ".join(words), total
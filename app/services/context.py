@@ -0,0 +1,92 @@
+"""Token-budgeted assembly of the LLM context from retrieved chunks.
+
+Chunks are taken in relevance order while the rendered context fits the
+budget. Neighbouring chunks of one document (``chunk_index`` n and n+1)
+are merged into a single passage with the overlap they share written once.
+"""
+from typing import Any, Callable, Dict, List, Tuple
+
+# Shorter suffix/prefix matches are treated as coincidence, not chunk overlap
+MIN_MERGE_OVERLAP = 20
+
+TokenCounter = Callable[[List[str]], List[int]]
+
+def merge_overlapping(first: str, second: str, min_overlap: int = MIN_MERGE_OVERLAP) -> str:
+    """Join consecutive chunks, dropping the longest suffix of ``first`` that starts ``second``"""
+    for size in range(min(len(first), len(second)), min_overlap - 1, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return f"{first} {second}"
+
+def build_passages(chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Group chunks into passages of consecutive chunks per document
+
+    Passages are ordered by the rank of their best chunk; ``chunks`` must be
+    in relevance order.
+    """
+    ranked = {id(chunk): rank for rank, chunk in enumerate(chunks)}
+    by_document: Dict[str, List[Dict[str, Any]]] = {}
+    for chunk in chunks:
+        by_document.setdefault(chunk["document_id"], []).append(chunk)
+
+    passages = []
+    for document_chunks in by_document.values():
+        document_chunks = sorted(document_chunks, key=lambda chunk: chunk["chunk_index"])
+        run = [document_chunks[0]]
+        for chunk in document_chunks[1:]:
+            if chunk["chunk_index"] == run[-1]["chunk_index"] + 1:
+                run.append(chunk)
+            else:
+                passages.append(_passage(run, ranked))
+                run = [chunk]
+        passages.append(_passage(run, ranked))
+
+    passages.sort(key=lambda passage: passage["rank"])
+    return passages
+
+def render_context(passages: List[Dict[str, Any]]) -> str:
+    """Build the prompt context from passages"""
+    context_parts = []
+
+    for i, passage in enumerate(passages, 1):
+        first, last = passage["first_index"], passage["last_index"]
+        fragment = f"fragmento {first}" if first == last else f"fragmentos {first}-{last}"
+        source_info = f"Fuente {i}: {passage['filename']} ({fragment})"
+        context_parts.append(f"{source_info}\n{passage['content']}\n")
+
+    return "\n".join(context_parts)
+
+def pack_context(chunks: List[Dict[str, Any]], token_budget: int,
+                 count_tokens: TokenCounter) -> Tuple[str, int, List[Dict[str, Any]]]:
+    """Fit the most relevant chunks into ``token_budget`` tokens of context
+
+    Returns (context, tokens, packed chunks). Chunks are tried in relevance
+    order and skipped when the rendered context would exceed the budget, so
+    a smaller, less relevant chunk can still fill the remaining room. The
+    best chunk is always kept. A budget of 0 keeps every chunk.
+    """
+    packed: List[Dict[str, Any]] = []
+    context, tokens = "", 0
+
+    for chunk in chunks:
+        candidate = packed + [chunk]
+        candidate_context = render_context(build_passages(candidate))
+        candidate_tokens = count_tokens([candidate_context])[0]
+        if packed and token_budget and candidate_tokens > token_budget:
+            continue
+        packed, context, tokens = candidate, candidate_context, candidate_tokens
+
+    return context, tokens, packed
+
+def _passage(run: List[Dict[str, Any]], ranked: Dict[int, int]) -> Dict[str, Any]:
+    content = run[0]["content"]
+    for chunk in run[1:]:
+        content = merge_overlapping(content, chunk["content"])
+    return {
+        "document_id": run[0]["document_id"],
+        "filename": run[0]["filename"],
+        "first_index": run[0]["chunk_index"],
+        "last_index": run[-1]["chunk_index"],
+        "content": content,
+        "rank": min(ranked[id(chunk)] for chunk in run)
+    }
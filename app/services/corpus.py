@@ -0,0 +1,55 @@
+import os
+import mmap
+import fcntl
+import struct
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_COUNTER = struct.Struct("<Q")
+
+class SharedCounter:
+    """Monotonic counter kept in a small file shared by every process that opens it
+
+    The file is memory-mapped, so reading the current value costs no
+    syscall beyond a shared ``flock``; increments hold an exclusive one.
+    Processes (uvicorn workers) must share the file's directory.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        with self._file_lock(fcntl.LOCK_EX):
+            if os.fstat(self._fd).st_size < _COUNTER.size:
+                os.ftruncate(self._fd, _COUNTER.size)
+        self._map = mmap.mmap(self._fd, _COUNTER.size)
+
+    @property
+    def value(self) -> int:
+        """Current value, as last written by any process"""
+        with self._file_lock(fcntl.LOCK_SH):
+            return _COUNTER.unpack_from(self._map)[0]
+
+    def increment(self) -> int:
+        """Add one and return the new value"""
+        with self._file_lock(fcntl.LOCK_EX):
+            value = _COUNTER.unpack_from(self._map)[0] + 1
+            _COUNTER.pack_into(self._map, 0, value)
+            return value
+
+    def close(self):
+        """Unmap and close the counter file"""
+        self._map.close()
+        os.close(self._fd)
+
+    @contextmanager
+    def _file_lock(self, operation: int):
+        fcntl.flock(self._fd, operation)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
@@ -0,0 +1,143 @@
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Lower rank is served first
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+# Weight of the newest call in the moving average of call durations
+_SERVICE_TIME_SMOOTHING = 0.2
+
+class LLMOverloaded(Exception):
+    """Raised when an LLM call cannot start before its queue deadline"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class LLMDispatcher:
+    """Bounds in-flight LLM calls and queues the rest by priority
+
+    Up to ``max_in_flight`` calls run at once. Others wait in a priority
+    queue of at most ``max_queue`` entries, each for at most its priority
+    class's deadline. A call is shed immediately when the queue is full or
+    when the expected wait, estimated from recent call durations, already
+    exceeds its deadline.
+    """
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeouts: Dict[str, float]):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeouts = queue_timeouts
+        self._in_flight = 0
+        self._queued = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._service_time: Optional[float] = None
+        self._counters = {"admitted": 0, "enqueued": 0, "shed": 0, "timed_out": 0}
+
+    @asynccontextmanager
+    async def slot(self, priority: str = "interactive") -> AsyncIterator[None]:
+        """Hold one of the in-flight slots for the duration of an LLM call"""
+        await self._acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self._observe(time.monotonic() - start)
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return current load and admission counters"""
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self._in_flight,
+            "max_queue": self.max_queue,
+            "queued": self._queued,
+            "avg_call_seconds": round(self._service_time, 3) if self._service_time is not None else None,
+            **self._counters
+        }
+
+    async def _acquire(self, priority: str):
+        rank = PRIORITIES[priority]
+        timeout = self.queue_timeouts[priority]
+
+        if self._in_flight < self.max_in_flight and not self._queued:
+            self._in_flight += 1
+            self._counters["admitted"] += 1
+            return
+
+        if self._queued >= self.max_queue:
+            self._shed(f"LLM queue is full ({self.max_queue} waiting)", timeout)
+
+        # Everyone of the same or higher priority is served first
+        ahead = sum(1 for waiter_rank, _, future in self._waiters if waiter_rank <= rank and not future.done())
+        expected_wait = self._expected_wait(ahead)
+        if expected_wait > timeout:
+            self._shed(f"LLM queue wait of ~{expected_wait:.1f}s exceeds the {timeout:.0f}s deadline", expected_wait)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (rank, next(self._sequence), future))
+        self._queued += 1
+        self._counters["enqueued"] += 1
+        try:
+            await asyncio.wait({future}, timeout=timeout)
+        except asyncio.CancelledError:
+            if future.done():
+                # The slot was handed over just as the caller went away
+                self._release()
+            else:
+                future.cancel()
+                self._queued -= 1
+            raise
+
+        if not future.done():
+            future.cancel()
+            self._queued -= 1
+            self._counters["timed_out"] += 1
+            raise LLMOverloaded(f"LLM call waited {timeout:.0f}s without a free slot", math.ceil(timeout))
+        self._counters["admitted"] += 1
+
+    def _release(self):
+        # Hand the slot straight to the best live waiter, if any
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._queued -= 1
+                future.set_result(None)
+                return
+        self._in_flight -= 1
+
+    def _expected_wait(self, ahead: int) -> float:
+        if self._service_time is None:
+            return 0.0
+        return (ahead + 1) / self.max_in_flight * self._service_time
+
+    def _observe(self, seconds: float):
+        if self._service_time is None:
+            self._service_time = seconds
+        else:
+            self._service_time += _SERVICE_TIME_SMOOTHING * (seconds - self._service_time)
+
+    def _shed(self, reason: str, retry_after: float):
+        self._counters["shed"] += 1
+        logger.warning(f"Shedding LLM call: {reason}")
+        raise LLMOverloaded(reason, max(1, math.ceil(retry_after)))
+
+# Global instance
+llm_dispatcher = LLMDispatcher(
+    max_in_flight=settings.LLM_MAX_IN_FLIGHT,
+    max_queue=settings.LLM_MAX_QUEUE,
+    queue_timeouts={
+        "interactive": settings.LLM_QUEUE_TIMEOUT,
+        "batch": settings.LLM_BATCH_QUEUE_TIMEOUT
+    }
+)
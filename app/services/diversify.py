@@ -0,0 +1,40 @@
+"""Near-duplicate removal for retrieved chunks.
+
+Re-uploads of a document under another name and overlapping neighbours
+can put almost the same text in several result slots. Chunks are compared
+by the Jaccard similarity of their word shingles; the retrieved set is
+small, so the exact pairwise comparison is cheaper than MinHash sketches.
+"""
+import re
+from typing import Any, Dict, FrozenSet, List
+
+_WORD = re.compile(r"\w+")
+
+def shingles(text: str, size: int = 3) -> FrozenSet[str]:
+    """Set of ``size``-word shingles of a text, case-insensitive"""
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return frozenset([" ".join(words)])
+    return frozenset(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+
+def jaccard(first: FrozenSet[str], second: FrozenSet[str]) -> float:
+    """Jaccard similarity of two shingle sets"""
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+def remove_near_duplicates(chunks: List[Dict[str, Any]], threshold: float,
+                           shingle_size: int = 3) -> List[Dict[str, Any]]:
+    """Drop chunks whose shingle similarity to a better-ranked kept chunk reaches ``threshold``
+
+    ``chunks`` must be in relevance order; the order of kept chunks is preserved.
+    """
+    kept: List[Dict[str, Any]] = []
+    kept_shingles: List[FrozenSet[str]] = []
+    for chunk in chunks:
+        chunk_shingles = shingles(chunk["content"], shingle_size)
+        if any(jaccard(chunk_shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(chunk)
+        kept_shingles.append(chunk_shingles)
+    return kept
@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_HASH_BYTES = 32  # sha256 digest
+
+class DiskEmbeddingStore:
+    """Append-only on-disk store of float32 embeddings keyed by chunk content hash
+
+    One directory per model holds ``vectors.f32`` (rows of ``dim`` floats,
+    read through a memory map), ``index.bin`` (the raw sha256 digest of
+    row i at offset 32*i) and ``meta.json``. Vectors are written before
+    their index entry, so a crash can only leave unindexed rows, which are
+    truncated before the next append.
+
+    Several processes (uvicorn workers) may share a directory: appends hold
+    an exclusive ``flock`` on ``store.lock`` and first pick up the rows other
+    processes indexed, so row numbers always come from the file itself.
+    """
+
+    def __init__(self, directory: str, model_name: str, dim: int):
+        self.directory = directory
+        self.model_name = model_name
+        self.dim = dim
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._index_path = os.path.join(directory, "index.bin")
+        self._lock_path = os.path.join(directory, "store.lock")
+        self._rows: Dict[bytes, int] = {}
+        self._row_count = 0
+        self._mmap: Optional[np.memmap] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._open()
+
+    def get_many(self, content_hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Return the stored vectors for the hashes that are present"""
+        found = {}
+        with self._lock:
+            with self._file_lock(fcntl.LOCK_SH):
+                self._sync()
+            rows = {h: self._rows.get(bytes.fromhex(h)) for h in content_hashes}
+            wanted = {h: row for h, row in rows.items() if row is not None}
+            if wanted:
+                vectors = self._mapped()
+                for content_hash, row in wanted.items():
+                    found[content_hash] = np.array(vectors[row])
+            self.hits += len(found)
+            self.misses += len(content_hashes) - len(found)
+        return found
+
+    def put_many(self, content_hashes: List[str], vectors: List[List[float]]):
+        """Append vectors for hashes that are not stored yet"""
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            # Rows appended by other processes shift where ours land
+            self._sync()
+            new_keys, new_rows = {}, []
+            for content_hash, vector in zip(content_hashes, vectors):
+                key = bytes.fromhex(content_hash)
+                if key not in self._rows and key not in new_keys:
+                    new_keys[key] = len(new_rows)
+                    new_rows.append(vector)
+            if not new_keys:
+                return
+
+            # Drop vectors a crashed writer left without an index entry
+            os.truncate(self._vectors_path, self._row_count * self.dim * 4)
+            block = np.asarray(new_rows, dtype=np.float32).reshape(len(new_rows), self.dim)
+            with open(self._vectors_path, "ab") as vectors_file:
+                vectors_file.write(block.tobytes())
+                vectors_file.flush()
+                os.fsync(vectors_file.fileno())
+            with open(self._index_path, "ab") as index_file:
+                index_file.write(b"".join(new_keys))
+
+            for key, offset in new_keys.items():
+                self._rows[key] = self._row_count + offset
+            self._row_count += len(new_rows)
+            self._mmap = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Return size and hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "directory": self.directory,
+                "vectors": len(self._rows),
+                "bytes": self._row_count * self.dim * 4,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    def _mapped(self) -> np.ndarray:
+        # Remapped lazily after appends; rows are copied out before returning
+        if self._mmap is None:
+            self._mmap = np.memmap(self._vectors_path, dtype=np.float32, mode="r",
+                                   shape=(self._row_count, self.dim))
+        return self._mmap
+
+    @contextmanager
+    def _file_lock(self, operation: int):
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _sync(self):
+        # Index entries are written after their vectors, so every complete
+        # entry past our row count points at a vector already on disk
+        rows = os.path.getsize(self._index_path) // _HASH_BYTES
+        if rows <= self._row_count:
+            return
+        with open(self._index_path, "rb") as index_file:
+            index_file.seek(self._row_count * _HASH_BYTES)
+            tail = index_file.read((rows - self._row_count) * _HASH_BYTES)
+        for i in range(rows - self._row_count):
+            self._rows.setdefault(tail[i * _HASH_BYTES:(i + 1) * _HASH_BYTES], self._row_count + i)
+        self._row_count = rows
+        self._mmap = None
+
+    def _open(self):
+        os.makedirs(self.directory, exist_ok=True)
+        meta_path = os.path.join(self.directory, "meta.json")
+        meta = {"model": self.model_name, "dim": self.dim}
+
+        with self._file_lock(fcntl.LOCK_EX):
+            if os.path.exists(meta_path):
+                with open(meta_path) as meta_file:
+                    if json.load(meta_file) != meta:
+                        logger.warning(f"Embedding store at {self.directory} was built for another model; resetting")
+                        self._reset()
+            with open(meta_path, "w") as meta_file:
+                json.dump(meta, meta_file)
+
+            for path in (self._vectors_path, self._index_path):
+                open(path, "ab").close()
+
+            row_bytes = self.dim * 4
+            rows = min(os.path.getsize(self._vectors_path) // row_bytes,
+                       os.path.getsize(self._index_path) // _HASH_BYTES)
+            # Drop a partial index entry; unindexed vectors are dropped before the next append
+            os.truncate(self._index_path, rows * _HASH_BYTES)
+
+            self._rows = {}
+            self._row_count = 0
+            self._sync()
+        logger.info(f"Opened embedding store at {self.directory} with {self._row_count} vectors")
+
+    def _reset(self):
+        for path in (self._vectors_path, self._index_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+def store_directory(root: str, model_name: str) -> str:
+    """Directory of a model's store under ``root``"""
+    return os.path.join(root, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
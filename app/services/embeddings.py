@@ -0,0 +1,298 @@
+import re
+import sys
+import copy
+import time
+import queue
+import asyncio
+import logging
+import threading
+import itertools
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Tuple, Callable
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from app.config import settings
+from app.services.embedding_store import DiskEmbeddingStore, store_directory
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+class EmbeddingCache:
+    """Byte-bounded LRU cache of float32 embeddings keyed by model and text"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_name: str, text: str) -> Optional[np.ndarray]:
+        """Return the cached embedding for a text, if any"""
+        key = (model_name, self._normalize(text))
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, model_name: str, text: str, vector: np.ndarray):
+        """Store an embedding, evicting least recently used entries over budget"""
+        key = (model_name, self._normalize(text))
+        vector = np.asarray(vector, dtype=np.float32)
+        size = self._entry_size(key, vector)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= self._entry_size(key, previous)
+            self._entries[key] = vector
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                old_key, old_vector = self._entries.popitem(last=False)
+                self.current_bytes -= self._entry_size(old_key, old_vector)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit rate and memory usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return _WHITESPACE.sub(" ", text).strip()
+
+    @staticmethod
+    def _entry_size(key: Tuple[str, str], vector: np.ndarray) -> int:
+        # Vector payload plus the key text; model names are shared strings
+        return vector.nbytes + sys.getsizeof(key[1])
+
+# Batcher queue ranks; lower is served first and the stop marker drains last
+QUERY_PRIORITY = 0
+BULK_PRIORITY = 1
+_STOP_PRIORITY = 2
+
+class _EncodeRequest:
+    __slots__ = ("texts", "future")
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.future: Future = Future()
+
+class EmbeddingBatcher:
+    """Coalesces concurrent encode requests into batched model calls
+
+    Requests wait in a priority queue, so single query texts are picked up
+    ahead of ingestion slices queued before them.
+    """
+
+    def __init__(self, encode_batch: Callable[[List[str]], np.ndarray], max_batch_items: int,
+                 max_wait_ms: float, workers: int):
+        self._encode_batch = encode_batch
+        self.max_batch_items = max_batch_items
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.PriorityQueue[Tuple[int, int, Optional[_EncodeRequest]]]" = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self._threads = [
+            threading.Thread(target=self._run, name=f"embedding-batcher-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, texts: List[str], priority: int = QUERY_PRIORITY) -> Future:
+        """Queue texts for encoding; the future resolves to a float32 array"""
+        request = _EncodeRequest(texts)
+        self._queue.put((priority, next(self._sequence), request))
+        return request.future
+
+    def stop(self):
+        """Stop the batcher threads once queued work is drained"""
+        for _ in self._threads:
+            self._queue.put((_STOP_PRIORITY, next(self._sequence), None))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return batching counters"""
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+                "pending_requests": self._queue.qsize()
+            }
+
+    def _run(self):
+        while True:
+            _, _, first = self._queue.get()
+            if first is None:
+                return
+
+            batch, stopping = self._collect(first)
+            self._process(batch)
+            if stopping:
+                return
+
+    def _collect(self, first: _EncodeRequest) -> Tuple[List[_EncodeRequest], bool]:
+        """Gather requests until the batch is full or the wait window closes"""
+        batch = [first]
+        count = len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+
+        while count < self.max_batch_items:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                _, _, request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+            count += len(request.texts)
+
+        return batch, False
+
+    def _process(self, batch: List[_EncodeRequest]):
+        texts = [text for request in batch for text in request.texts]
+        try:
+            vectors = self._encode_batch(texts)
+        except Exception as e:
+            logger.error(f"Batched encode of {len(texts)} texts failed: {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        with self._lock:
+            self.batches += 1
+            self.items += len(texts)
+
+        offset = 0
+        for request in batch:
+            request.future.set_result(vectors[offset:offset + len(request.texts)])
+            offset += len(request.texts)
+
+class EmbeddingService:
+    def __init__(self):
+        self.model_name = settings.EMBEDDING_MODEL
+        self.batch_size = settings.EMBEDDING_BATCH_SIZE
+        self.model = SentenceTransformer(self.model_name)
+        # Fast tokenizers are not safe to call from several threads at once and
+        # keep truncation state between calls; token counting gets its own
+        # copy so it never races model.encode on the batcher threads
+        self._count_tokenizer = copy.deepcopy(self.model.tokenizer)
+        self._tokenizer_lock = threading.Lock()
+        self.cache = EmbeddingCache(settings.EMBEDDING_CACHE_MAX_BYTES)
+        # Persistent vectors of ingested chunks, keyed by content hash
+        self.store: Optional[DiskEmbeddingStore] = None
+        if settings.EMBEDDING_STORE_ENABLED:
+            self.store = DiskEmbeddingStore(
+                store_directory(settings.EMBEDDING_STORE_DIR, self.model_name),
+                self.model_name,
+                self.model.get_sentence_embedding_dimension()
+            )
+        self.batcher = EmbeddingBatcher(
+            self._encode_batch,
+            max_batch_items=settings.EMBEDDING_BATCH_MAX_ITEMS,
+            max_wait_ms=settings.EMBEDDING_BATCH_WAIT_MS,
+            workers=settings.EMBEDDING_WORKERS
+        )
+        logger.info(f"Loaded embedding model: {self.model_name}")
+
+    def encode(self, texts: List[str], on_progress: Optional[Callable[[int], None]] = None) -> List[List[float]]:
+        """Encode a batch of texts into embedding vectors"""
+        embeddings = []
+        for future in self._submit_slices(texts):
+            embeddings.extend(future.result().tolist())
+            if on_progress:
+                on_progress(len(embeddings))
+        return embeddings
+
+    def encode_one(self, text: str) -> List[float]:
+        """Encode a single text into an embedding vector, using the cache"""
+        vector = self.cache.get(self.model_name, text)
+        if vector is None:
+            vector = self.batcher.submit([text]).result()[0]
+            self.cache.put(self.model_name, text, vector)
+        return vector.tolist()
+
+    async def aencode(self, texts: List[str]) -> List[List[float]]:
+        """Encode a batch of texts without blocking the event loop"""
+        results = await asyncio.gather(
+            *(asyncio.wrap_future(future) for future in self._submit_slices(texts))
+        )
+        return [vector for vectors in results for vector in vectors.tolist()]
+
+    async def aencode_one(self, text: str) -> List[float]:
+        """Encode a single text through the batcher, using the cache"""
+        vector = self.cache.get(self.model_name, text)
+        if vector is None:
+            vectors = await asyncio.wrap_future(self.batcher.submit([text]))
+            vector = vectors[0]
+            self.cache.put(self.model_name, text, vector)
+        return vector.tolist()
+
+    @property
+    def max_tokens(self) -> int:
+        """Tokens of text the model embeds before truncating, excluding special tokens"""
+        return self.model.max_seq_length - self.model.tokenizer.num_special_tokens_to_add()
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Count model tokens per text, without special tokens, in one batched call"""
+        with self._tokenizer_lock:
+            encoded = self._count_tokenizer(
+                texts,
+                add_special_tokens=False,
+                return_attention_mask=False,
+                return_token_type_ids=False,
+                verbose=False
+            )
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return embedding cache and batching statistics"""
+        return {
+            "model": self.model_name,
+            **self.cache.stats(),
+            "batching": self.batcher.stats(),
+            "store": self.store.stats() if self.store else None
+        }
+
+    def shutdown(self):
+        """Stop the embedding batcher"""
+        self.batcher.stop()
+
+    def _submit_slices(self, texts: List[str]) -> List[Future]:
+        # Large ingestion batches are submitted in slices at bulk priority, so
+        # a query waits for at most the slice a worker is already encoding
+        step = self.batcher.max_batch_items
+        return [self.batcher.submit(texts[i:i + step], BULK_PRIORITY) for i in range(0, len(texts), step)]
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        ).astype(np.float32, copy=False)
+
+# Global instance
+embedding_service = EmbeddingService()
@@ -0,0 +1,51 @@
+"""Text extraction that runs in worker processes.
+
+pypdf and python-docx are pure Python and hold the GIL while parsing, so
+extraction is shipped to a process pool. This module is kept free of heavy
+imports (embedding model, Weaviate client) so spawned workers start fast.
+"""
+import logging
+from concurrent.futures import Executor, as_completed
+from typing import List, Callable, Optional
+import pypdf
+from docx import Document
+
+logger = logging.getLogger(__name__)
+
+def count_pdf_pages(file_path: str) -> int:
+    """Return the number of pages in a PDF"""
+    with open(file_path, "rb") as file:
+        return len(pypdf.PdfReader(file).pages)
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> List[str]:
+    """Extract the text of pages [start, end) of a PDF"""
+    with open(file_path, "rb") as file:
+        pdf_reader = pypdf.PdfReader(file)
+        return [pdf_reader.pages[i].extract_text() for i in range(start, end)]
+
+def extract_docx_text(file_path: str) -> str:
+    """Extract text from a DOCX file"""
+    doc = Document(file_path)
+    return "".join(paragraph.text + "\n" for paragraph in doc.paragraphs).strip()
+
+def extract_pdf_text(executor: Executor, file_path: str, pages_per_shard: int,
+                     on_pages: Optional[Callable[[int], None]] = None) -> str:
+    """Extract a PDF by sharding page ranges across the executor
+
+    Shards may finish in any order; the text is reassembled in page order.
+    ``on_pages`` receives the running count of extracted pages.
+    """
+    total_pages = count_pdf_pages(file_path)
+    futures = [
+        executor.submit(extract_pdf_pages, file_path, start, min(start + pages_per_shard, total_pages))
+        for start in range(0, total_pages, pages_per_shard)
+    ]
+
+    extracted = 0
+    for future in as_completed(futures):
+        extracted += len(future.result())
+        if on_pages:
+            on_pages(extracted)
+
+    pages = [page for future in futures for page in future.result()]
+    return "".join(page + "\n" for page in pages).strip()
@@ -0,0 +1,136 @@
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable, Awaitable
+from app.config import settings
+from app.services.vectorstore import vectorstore
+from app.services.llm import llm_client
+
+logger = logging.getLogger(__name__)
+
+Probe = Callable[[], Awaitable[bool]]
+
+class HealthMonitor:
+    """Probes dependencies in the background and serves the last results
+
+    Liveness never touches a dependency, readiness reads the cached results,
+    and only the opt-in deep check runs an LLM completion on demand.
+    """
+
+    def __init__(self, interval: float, timeout: float, stale_intervals: int):
+        self.interval = interval
+        self.timeout = timeout
+        self.stale_after = interval * stale_intervals
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._deep_lock: Optional[asyncio.Lock] = None
+        self._deep_result: Optional[Dict[str, Any]] = None
+
+    async def start(self):
+        """Run a first round of checks and start the background refresher"""
+        self._deep_lock = asyncio.Lock()
+        await self.refresh()
+        self._task = asyncio.create_task(self._refresher(), name="health-refresher")
+        logger.info(f"Health refresher started (every {self.interval}s)")
+
+    async def stop(self):
+        """Cancel the background refresher"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def refresh(self):
+        """Probe every dependency once and cache the results"""
+        probes = self._probes()
+        results = await asyncio.gather(*(self._check(probe) for probe in probes.values()))
+        self._results = dict(zip(probes, results))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return the cached dependency results and the overall status"""
+        checks = {name: self._current(result) for name, result in self._results.items()}
+        return {
+            "status": self._overall(checks),
+            "checks": checks,
+            "timestamp": datetime.now()
+        }
+
+    def is_ready(self) -> bool:
+        """Whether queries can be served; the LLM is optional, the vector store is not"""
+        return self.snapshot()["status"] != "unhealthy"
+
+    async def deep_check(self) -> Dict[str, Any]:
+        """Run a real one-token LLM completion alongside the vector store probe
+
+        Concurrent callers share one run, and a result younger than the
+        refresh interval is served from cache.
+        """
+        async with self._deep_lock:
+            if self._deep_result and time.monotonic() - self._deep_result["monotonic"] < self.interval:
+                return self._deep_result["report"]
+
+            weaviate, llm = await asyncio.gather(
+                self._check(lambda: vectorstore.is_ready(self.timeout)),
+                self._check(llm_client.test_connection, settings.LLM_TIMEOUT)
+            )
+            checks = {name: self._public(result) for name, result in (("weaviate", weaviate), ("llm", llm))}
+            report = {"status": self._overall(checks), "checks": checks, "timestamp": datetime.now()}
+            self._deep_result = {"report": report, "monotonic": time.monotonic()}
+            return report
+
+    def _probes(self) -> Dict[str, Probe]:
+        return {
+            "weaviate": lambda: vectorstore.is_ready(self.timeout),
+            "llm": lambda: llm_client.ping(self.timeout)
+        }
+
+    async def _check(self, probe: Probe, timeout: Optional[float] = None) -> Dict[str, Any]:
+        start = time.monotonic()
+        try:
+            ok = await asyncio.wait_for(probe(), timeout or self.timeout)
+        except Exception as e:
+            logger.error(f"Health probe failed: {e!r}")
+            ok = False
+        return {
+            "status": "ok" if ok else "error",
+            "latency_ms": round((time.monotonic() - start) * 1000, 1),
+            "checked_at": datetime.now(),
+            "monotonic": time.monotonic()
+        }
+
+    def _current(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        # A result the refresher failed to renew no longer vouches for anything
+        age = time.monotonic() - result["monotonic"]
+        status = result["status"] if age <= self.stale_after else "stale"
+        return {
+            "status": status,
+            "latency_ms": result["latency_ms"],
+            "checked_at": result["checked_at"],
+            "age_seconds": round(age, 1)
+        }
+
+    def _public(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in result.items() if key != "monotonic"}
+
+    def _overall(self, checks: Dict[str, Dict[str, Any]]) -> str:
+        if not checks or checks.get("weaviate", {}).get("status") != "ok":
+            return "unhealthy"
+        if any(check["status"] != "ok" for check in checks.values()):
+            return "degraded"
+        return "healthy"
+
+    async def _refresher(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Health refresh failed: {e}")
+
+# Global instance
+health_monitor = HealthMonitor(
+    interval=settings.HEALTH_CHECK_INTERVAL,
+    timeout=settings.HEALTH_CHECK_TIMEOUT,
+    stale_intervals=settings.HEALTH_STALE_INTERVALS
+)
@@ -1,41 +1,70 @@
 import os
 import uuid
 import logging
-from typing import List, Dict, Any, Optional
+import tarfile
+import zipfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Callable, Tuple, Iterable, Iterator
 from pathlib import Path
-import pypdf
-from docx import Document
-from sentence_transformers import SentenceTransformer
 from app.config import settings
+from app.services import chunking, extraction
+from app.services.embeddings import embedding_service
 
 logger = logging.getLogger(__name__)
 
+# Namespace for deterministic document and chunk IDs
+ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "medicopilot/documents")
+
+def document_id_for(key: str) -> str:
+    """Stable document ID for a logical document, keyed by its filename or an explicit document key"""
+    return str(uuid.uuid5(ID_NAMESPACE, key))
+
+def chunk_id_for(document_id: str, content_hash: str) -> str:
+    """Stable chunk ID: the same text in the same document maps to the same object"""
+    return str(uuid.uuid5(ID_NAMESPACE, f"{document_id}/{content_hash}"))
+
 class DocumentProcessor:
     def __init__(self):
-        self.embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
-        logger.info(f"Loaded embedding model: {settings.EMBEDDING_MODEL}")
+        self.embedding_service = embedding_service
+        self._extraction_pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+    
+    @property
+    def extraction_pool(self) -> ProcessPoolExecutor:
+        """Process pool for CPU-bound text extraction, created on first use"""
+        with self._pool_lock:
+            if self._extraction_pool is None:
+                # spawn: forked children would inherit the embedding model's threads
+                self._extraction_pool = ProcessPoolExecutor(
+                    max_workers=settings.EXTRACTION_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info(f"Started extraction pool with {settings.EXTRACTION_WORKERS} workers")
+            return self._extraction_pool
+    
+    def shutdown(self):
+        """Stop the extraction process pool"""
+        with self._pool_lock:
+            if self._extraction_pool is not None:
+                self._extraction_pool.shutdown(wait=False, cancel_futures=True)
+                self._extraction_pool = None
     
-    def process_document(self, file_path: str, filename: str) -> Dict[str, Any]:
-        """Process a document and return chunks with embeddings"""
+    def process_document(self, file_path: str, filename: str, document_id: Optional[str] = None,
+                         progress: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
+        """Process a document and return chunks with embeddings
+        
+        ``progress`` is called with keyword counters (pages_extracted,
+        chunks_total, chunks_embedded, truncation stats) as the work advances.
+        """
+        progress = progress or (lambda **counters: None)
         try:
-            # Extract text based on file type
-            text = self._extract_text(file_path, filename)
-            if not text:
-                raise ValueError("Could not extract text from document")
-            
-            # Generate document ID
-            document_id = str(uuid.uuid4())
-            
-            # Chunk the text
-            chunks = self._chunk_text(text, document_id, filename)
+            # Re-uploads of the same file keep their document ID
+            document_id = document_id or document_id_for(filename)
             
-            # Generate embeddings for each chunk
-            chunk_texts = [chunk["content"] for chunk in chunks]
-            embeddings = self.embedding_model.encode(chunk_texts).tolist()
-            
-            # Add embeddings to chunks
-            for i, chunk in enumerate(chunks):
-                chunk["vector"] = embeddings[i]
+            chunks = self.prepare_chunks(file_path, filename, document_id, progress)
+            self.embed_chunks(chunks, progress)
             
             logger.info(f"Processed document {filename}: {len(chunks)} chunks created")
             
@@ -50,107 +79,218 @@ class DocumentProcessor:
             logger.error(f"Error processing document {filename}: {e}")
             raise
     
-    def _extract_text(self, file_path: str, filename: str) -> str:
+    def prepare_chunks(self, file_path: str, filename: str, document_id: str,
+                       progress: Optional[Callable[..., None]] = None) -> List[Dict[str, Any]]:
+        """Extract and chunk a document without embedding it"""
+        progress = progress or (lambda **counters: None)
+        
+        if Path(filename).suffix.lower() == ".txt":
+            # Plain text is read and chunked block by block, never held whole
+            sentences = self._stream_txt_sentences(file_path)
+            chunks = self._chunk_sentences(sentences, document_id, filename)
+            progress(pages_extracted=1)
+        else:
+            # Extract text based on file type
+            text = self._extract_text(file_path, filename, progress)
+            chunks = self._chunk_text(text, document_id, filename)
+        
+        if not chunks:
+            raise ValueError("Could not extract text from document")
+        progress(chunks_total=len(chunks), **self._truncation_stats(chunks, filename))
+        return chunks
+    
+    def embed_chunks(self, chunks: List[Dict[str, Any]], progress: Optional[Callable[..., None]] = None):
+        """Attach embedding vectors to chunks in place, possibly across documents"""
+        progress = progress or (lambda **counters: None)
+        store = self.embedding_service.store
+        
+        # Vectors computed by earlier ingestions are read back from disk
+        cached = store.get_many([chunk["content_hash"] for chunk in chunks]) if store else {}
+        for chunk in chunks:
+            if chunk["content_hash"] in cached:
+                chunk["vector"] = cached[chunk["content_hash"]].tolist()
+        missing = [chunk for chunk in chunks if chunk["content_hash"] not in cached]
+        progress(chunks_cached=len(chunks) - len(missing), chunks_embedded=len(chunks) - len(missing))
+        
+        # Generate embeddings for the remaining chunks
+        embeddings = self.embedding_service.encode(
+            [chunk["content"] for chunk in missing],
+            on_progress=lambda done: progress(chunks_embedded=len(chunks) - len(missing) + done)
+        )
+        
+        # Add embeddings to chunks
+        for chunk, embedding in zip(missing, embeddings):
+            chunk["vector"] = embedding
+        if store and missing:
+            store.put_many([chunk["content_hash"] for chunk in missing], embeddings)
+    
+    def expand_archive(self, archive_path: str, archive_name: str, target_dir: str) -> List[Tuple[str, str]]:
+        """Unpack supported documents from a zip/tar archive
+        
+        Members are written under unique names in ``target_dir``; returns
+        (file_path, filename) pairs. Unsupported or oversized members are skipped.
+        Raises ValueError, leaving no file behind, when the archive expands past
+        BULK_MAX_EXTRACTED_SIZE or ARCHIVE_MAX_COMPRESSION_RATIO times its own size;
+        both are counted on the bytes actually written, not the declared sizes.
+        """
+        extracted = []
+        max_extracted = min(
+            settings.BULK_MAX_EXTRACTED_SIZE,
+            settings.ARCHIVE_MAX_COMPRESSION_RATIO * os.path.getsize(archive_path)
+        )
+        total = 0
+        
+        def add_member(name: str, size: int, open_member: Callable[[], Any]):
+            nonlocal total
+            filename = os.path.basename(name)
+            file_ext = Path(filename).suffix.lower()
+            if not filename or file_ext not in settings.ALLOWED_EXTENSIONS:
+                return
+            if size > settings.MAX_FILE_SIZE:
+                logger.warning(f"Skipping {name} in {archive_name}: file too large")
+                return
+            if len(extracted) >= settings.BULK_MAX_FILES:
+                raise ValueError(f"Archive {archive_name} has more than {settings.BULK_MAX_FILES} documents")
+            
+            file_path = os.path.join(target_dir, f"{uuid.uuid4()}{file_ext}")
+            written = 0
+            try:
+                with open_member() as source, open(file_path, "wb") as target:
+                    for block in iter(lambda: source.read(settings.STREAM_BLOCK_SIZE), b""):
+                        written += len(block)
+                        if written > settings.MAX_FILE_SIZE:
+                            raise ValueError(f"{name} in {archive_name} expands past its declared size")
+                        if total + written > max_extracted:
+                            raise ValueError(
+                                f"Archive {archive_name} expands to more than {int(max_extracted)} bytes"
+                            )
+                        target.write(block)
+            except BaseException:
+                os.remove(file_path)
+                raise
+            total += written
+            extracted.append((file_path, filename))
+        
+        try:
+            if zipfile.is_zipfile(archive_path):
+                with zipfile.ZipFile(archive_path) as archive:
+                    for info in archive.infolist():
+                        if not info.is_dir():
+                            add_member(info.filename, info.file_size, lambda info=info: archive.open(info))
+            elif tarfile.is_tarfile(archive_path):
+                with tarfile.open(archive_path) as archive:
+                    for member in archive.getmembers():
+                        if member.isfile():
+                            add_member(member.name, member.size, lambda member=member: archive.extractfile(member))
+            else:
+                raise ValueError(f"Unsupported archive format: {archive_name}")
+        except BaseException:
+            for file_path, _ in extracted:
+                os.remove(file_path)
+            raise
+        
+        return extracted
+    
+    def _extract_text(self, file_path: str, filename: str, progress: Callable[..., None]) -> str:
         """Extract text from different file types"""
         file_ext = Path(filename).suffix.lower()
         
         try:
             if file_ext == ".pdf":
-                return self._extract_pdf_text(file_path)
-            elif file_ext == ".txt":
-                return self._extract_txt_text(file_path)
+                return self._extract_pdf_text(file_path, progress)
             elif file_ext == ".docx":
-                return self._extract_docx_text(file_path)
+                text = self._extract_docx_text(file_path)
+                progress(pages_extracted=1)
+                return text
             else:
                 raise ValueError(f"Unsupported file type: {file_ext}")
         except Exception as e:
             logger.error(f"Error extracting text from {filename}: {e}")
             raise
     
-    def _extract_pdf_text(self, file_path: str) -> str:
-        """Extract text from PDF file"""
-        text = ""
-        with open(file_path, "rb") as file:
-            pdf_reader = pypdf.PdfReader(file)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        return text.strip()
+    def _extract_pdf_text(self, file_path: str, progress: Callable[..., None]) -> str:
+        """Extract text from PDF file, sharding page ranges across the process pool"""
+        return extraction.extract_pdf_text(
+            self.extraction_pool,
+            file_path,
+            settings.PDF_PAGES_PER_SHARD,
+            on_pages=lambda pages: progress(pages_extracted=pages)
+        )
     
-    def _extract_txt_text(self, file_path: str) -> str:
-        """Extract text from TXT file"""
+    def _stream_txt_sentences(self, file_path: str) -> Iterator[str]:
+        """Yield the sentences of a TXT file, reading it in fixed-size blocks"""
         with open(file_path, "r", encoding="utf-8") as file:
-            return file.read().strip()
+            yield from chunking.iter_block_sentences(iter(lambda: file.read(settings.STREAM_BLOCK_SIZE), ""))
     
     def _extract_docx_text(self, file_path: str) -> str:
-        """Extract text from DOCX file"""
-        doc = Document(file_path)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text.strip()
+        """Extract text from DOCX file in the process pool"""
+        return self.extraction_pool.submit(extraction.extract_docx_text, file_path).result()
     
     def _chunk_text(self, text: str, document_id: str, filename: str) -> List[Dict[str, Any]]:
         """Split text into overlapping chunks"""
-        chunks = []
-        chunk_size = settings.CHUNK_SIZE
-        chunk_overlap = settings.CHUNK_OVERLAP
-        
         # Split text into sentences for better chunking
-        sentences = self._split_into_sentences(text)
-        
-        current_chunk = ""
-        chunk_index = 0
-        
-        for i, sentence in enumerate(sentences):
-            # If adding this sentence would exceed chunk size, save current chunk
-            if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
-                chunks.append(self._create_chunk(
-                    current_chunk.strip(),
-                    document_id,
-                    filename,
-                    chunk_index
-                ))
-                chunk_index += 1
-                
-                # Start new chunk with overlap
-                overlap_text = self._get_overlap_text(current_chunk, chunk_overlap)
-                current_chunk = overlap_text + " " + sentence
-            else:
-                current_chunk += " " + sentence if current_chunk else sentence
+        return self._chunk_sentences(chunking.iter_sentences(text), document_id, filename)
+    
+    def _chunk_sentences(self, sentences: Iterable[str], document_id: str, filename: str) -> List[Dict[str, Any]]:
+        """Pack a stream of sentences into overlapping chunks, with their token counts"""
+        count_tokens = self.embedding_service.count_tokens
+        batch_size = settings.TOKENIZE_BATCH_SIZE
         
-        # Add the last chunk if it has content
-        if current_chunk.strip():
-            chunks.append(self._create_chunk(
-                current_chunk.strip(),
-                document_id,
-                filename,
-                chunk_index
-            ))
+        if settings.CHUNKING_MODE == "tokens":
+            max_tokens = self.embedding_service.max_tokens
+            if settings.CHUNK_TOKENS:
+                max_tokens = min(settings.CHUNK_TOKENS, max_tokens)
+            contents = chunking.iter_token_chunks(
+                sentences, count_tokens, max_tokens, settings.CHUNK_OVERLAP_TOKENS, batch_size
+            )
+        else:
+            contents = chunking.with_token_counts(
+                chunking.iter_chunks(sentences, settings.CHUNK_SIZE, settings.CHUNK_OVERLAP),
+                count_tokens,
+                batch_size
+            )
         
+        chunks = []
+        seen = set()
+        for content, tokens in contents:
+            # Indexes count kept chunks only, so they stay dense for paging and merging
+            chunk = self._create_chunk(content, document_id, filename, len(chunks), tokens)
+            # Repeated passages would map to the same chunk ID; keep the first
+            if chunk["chunk_id"] not in seen:
+                seen.add(chunk["chunk_id"])
+                chunks.append(chunk)
         return chunks
     
-    def _split_into_sentences(self, text: str) -> List[str]:
-        """Split text into sentences"""
-        import re
-        # Simple sentence splitting - can be improved with more sophisticated NLP
-        sentences = re.split(r'[.!?]+', text)
-        return [s.strip() for s in sentences if s.strip()]
-    
-    def _get_overlap_text(self, text: str, overlap_size: int) -> str:
-        """Get the last part of text for overlap"""
-        if len(text) <= overlap_size:
-            return text
-        return text[-overlap_size:].strip()
+    def _truncation_stats(self, chunks: List[Dict[str, Any]], filename: str) -> Dict[str, int]:
+        """Count chunks and tokens the embedding model will cut off"""
+        max_tokens = self.embedding_service.max_tokens
+        tokens = [chunk["metadata"]["tokens"] for chunk in chunks]
+        stats = {
+            "tokens_total": sum(tokens),
+            "chunks_truncated": sum(1 for n in tokens if n > max_tokens),
+            "tokens_truncated": sum(n - max_tokens for n in tokens if n > max_tokens)
+        }
+        if stats["chunks_truncated"]:
+            logger.warning(
+                f"{filename}: {stats['chunks_truncated']}/{len(chunks)} chunks exceed the "
+                f"{max_tokens}-token embedding window ({stats['tokens_truncated']} tokens dropped)"
+            )
+        return stats
     
-    def _create_chunk(self, content: str, document_id: str, filename: str, chunk_index: int) -> Dict[str, Any]:
+    def _create_chunk(self, content: str, document_id: str, filename: str, chunk_index: int,
+                      tokens: int) -> Dict[str, Any]:
         """Create a chunk dictionary"""
+        content_hash = chunking.content_hash(content, self.embedding_service.model_name)
         return {
+            "chunk_id": chunk_id_for(document_id, content_hash),
+            "content_hash": content_hash,
             "content": content,
             "document_id": document_id,
             "filename": filename,
             "chunk_index": chunk_index,
             "metadata": {
                 "chunk_size": len(content),
+                "tokens": tokens,
                 "created_at": "2024-01-01T00:00:00Z"  # Could add timestamp
             }
         }
@@ -0,0 +1,99 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Records in these states are still owned by a running worker process
+ACTIVE_STATUSES = ("queued", "processing")
+
+class JobStore:
+    """Ingestion job records as JSON files in a directory shared by all workers
+
+    A job runs in the worker that accepted its upload, but its progress may
+    be polled through any worker. Each save replaces the job's file
+    atomically, so readers see either the previous or the new record. Files
+    carry the owning process ID: an active job whose process is gone was
+    interrupted by a restart and is reported as failed.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, record: Dict[str, Any]):
+        """Write a job's public record"""
+        path = self._path(record["job_id"])
+        # Progress arrives from worker threads too; each writer has its own temp file
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"pid": os.getpid(), "job": record}, f, default=_encode)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to save ingestion job {record['job_id']}: {e}")
+
+    def load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Read a job's record, or None if it is unknown"""
+        try:
+            job_id = str(uuid.UUID(job_id))
+        except ValueError:
+            return None
+        try:
+            with open(self._path(job_id), encoding="utf-8") as f:
+                stored = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read ingestion job {job_id}: {e}")
+            return None
+        
+        record = stored["job"]
+        if record["status"] in ACTIVE_STATUSES and not _process_alive(stored["pid"]):
+            record.update(status="failed", error="Interrupted: the worker running this job exited")
+        return record
+
+    def load_all(self) -> List[Dict[str, Any]]:
+        """Read every stored job record"""
+        records = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                record = self.load(name[:-len(".json")])
+                if record is not None:
+                    records.append(record)
+        return records
+
+    def prune(self, keep: int):
+        """Delete the oldest finished records beyond the newest ``keep``"""
+        finished = [record for record in self.load_all() if record["status"] not in ACTIVE_STATUSES]
+        finished.sort(key=lambda record: record["updated_at"], reverse=True)
+        for record in finished[keep:]:
+            self.delete(record["job_id"])
+
+    def delete(self, job_id: str):
+        """Forget a job"""
+        try:
+            os.remove(self._path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
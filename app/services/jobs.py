@@ -0,0 +1,440 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple, AsyncIterator
+from fastapi.concurrency import run_in_threadpool
+from app.config import settings
+from app.services.ingest import document_processor, document_id_for
+from app.services.job_store import JobStore
+from app.services.vectorstore import vectorstore
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("completed", "completed_with_errors", "failed")
+
+# Per-object write errors kept on each document of a job
+MAX_REPORTED_WRITE_ERRORS = 10
+
+class IngestionQueueFull(Exception):
+    """Raised when the ingestion queue cannot take another job"""
+
+class IngestionJobManager:
+    """Bounded queue of document ingestion jobs processed by background workers"""
+
+    def __init__(self, workers: int, max_queue_size: int, history_size: int, store: JobStore):
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.history_size = history_size
+        # Jobs run by this process; their public records are mirrored to the store
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.store = store
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        # Per-document locks with their holder/waiter counts, dropped when unused
+        self._document_locks: Dict[str, Tuple[asyncio.Lock, int]] = {}
+
+    async def start(self):
+        """Start the background workers"""
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        await run_in_threadpool(self.store.prune, self.history_size)
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"ingestion-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info(f"Started {self.workers} ingestion workers (queue size {self.max_queue_size})")
+
+    async def stop(self):
+        """Cancel the background workers"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, file_path: str, filename: str, document_key: Optional[str] = None) -> Dict[str, Any]:
+        """Queue a saved upload for ingestion and return its job record
+        
+        The document is identified by ``document_key`` when given, else by its filename.
+        """
+        return self.submit_bulk([(file_path, filename)], [document_key])
+
+    def submit_bulk(self, files: List[Tuple[str, str]],
+                    document_keys: Optional[List[Optional[str]]] = None) -> Dict[str, Any]:
+        """Queue several saved uploads as one job whose chunks are embedded together"""
+        document_keys = document_keys or [None] * len(files)
+        if self._queue is None:
+            raise RuntimeError("Ingestion workers are not running")
+
+        now = datetime.now()
+        job = {
+            "job_id": str(uuid.uuid4()),
+            "status": "queued",
+            "chunks_cached": 0,
+            "chunks_embedded": 0,
+            "chunks_stored": 0,
+            "chunks_failed": 0,
+            "write_objects_per_second": 0.0,
+            "write_bytes_per_second": 0.0,
+            "chunks_unchanged": 0,
+            "chunks_deleted": 0,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "documents": [
+                {
+                    "document_id": document_id_for(document_key or filename),
+                    "filename": filename,
+                    "status": "queued",
+                    "pages_extracted": 0,
+                    "chunks_total": 0,
+                    "tokens_total": 0,
+                    "chunks_truncated": 0,
+                    "tokens_truncated": 0,
+                    "chunks_new": 0,
+                    "chunks_unchanged": 0,
+                    "chunks_deleted": 0,
+                    "error": None,
+                    "file_path": file_path
+                }
+                for (file_path, filename), document_key in zip(files, document_keys)
+            ],
+            # IDs of chunks this job wrote that did not exist before
+            "written_ids": [],
+            # Previous chunk_index of the stored chunks this job moved
+            "moved_indexes": {},
+            # When the record was last written to the store
+            "saved_at": 0.0
+        }
+        
+        # Files with the same document key are one logical document; the last copy wins
+        last_index = {document["document_id"]: i for i, document in enumerate(job["documents"])}
+        for i, document in enumerate(job["documents"]):
+            if last_index[document["document_id"]] != i:
+                document.update(status="failed", error="Superseded by a later file with the same name")
+
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise IngestionQueueFull(f"Ingestion queue is full ({self.max_queue_size} jobs pending)")
+
+        self._jobs[job["job_id"]] = job
+        self._save(job)
+        self._trim_history()
+        return self._public(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return the current state of a job, whichever worker runs it"""
+        job = self._jobs.get(job_id)
+        return self._public(job) if job else self.store.load(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return this worker's queue depth and job counts by status across workers"""
+        counts: Dict[str, int] = {}
+        for job in self.store.load_all():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "workers": self.workers,
+            "jobs": counts
+        }
+
+    async def _worker(self, worker_id: int):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ingestion job {job['job_id']} failed: {e}")
+                self._update(job, status="failed", error=str(e))
+            finally:
+                self._cleanup(job)
+                self._queue.task_done()
+
+    async def _run(self, job: Dict[str, Any]):
+        """Extract and chunk every document, then embed and store only the chunks that changed"""
+        self._update(job, status="processing")
+        documents = job["documents"]
+        
+        # Extraction is per document and runs in parallel
+        slots = asyncio.Semaphore(settings.INGEST_EXTRACT_CONCURRENCY)
+        chunk_lists = await asyncio.gather(*(self._prepare(job, document, slots) for document in documents))
+        
+        ready = [(d, chunks) for d, chunks in zip(documents, chunk_lists) if d["status"] == "extracted"]
+        if not ready:
+            raise RuntimeError("; ".join(f"{d['filename']}: {d['error']}" for d in documents))
+        
+        # Another job for the same document must not diff against a version
+        # this one is still replacing, or one would delete the other's chunks
+        async with self._lock_documents([document["document_id"] for document, _ in ready]):
+            try:
+                await self._store(job, ready)
+            except Exception:
+                await self._rollback(job)
+                raise
+    
+    async def _store(self, job: Dict[str, Any], ready: List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]):
+        """Embed and write the changed chunks of extracted documents, then drop stale ones"""
+        documents = job["documents"]
+        
+        # Chunk IDs are content addressed, so chunks already stored for the
+        # document are reused; only new ones and the ones whose position moved
+        # are written, the latter with their vectors from the embedding store
+        plans = [await run_in_threadpool(self._plan, job, document, chunks) for document, chunks in ready]
+        chunks = [chunk for plan in plans for chunk in plan["new"] + plan["moved"]]
+        new_ids = {chunk["chunk_id"] for plan in plans for chunk in plan["new"]}
+        previous_indexes = {
+            chunk_id: chunk_index for plan in plans for chunk_id, chunk_index in plan["previous_indexes"].items()
+        }
+        
+        write_errors: Dict[str, str] = {}
+        written = {"stored": 0, "bytes": 0, "seconds": 0.0}
+        embedded = {"chunks_cached": 0, "chunks_embedded": 0}
+        batch_size = settings.INGEST_STORE_BATCH_SIZE
+        window_size = settings.INGEST_EMBED_WINDOW
+        
+        # Chunks are embedded, written and released one window at a time, so a
+        # large bulk job never holds all its vectors; windows span documents
+        # to keep embedding batches full
+        for window_start in range(0, len(chunks), window_size):
+            window = chunks[window_start:window_start + window_size]
+            await run_in_threadpool(
+                document_processor.embed_chunks,
+                window,
+                lambda **counters: self._update(job, **{key: embedded[key] + value for key, value in counters.items()})
+            )
+            for key in embedded:
+                embedded[key] = job[key]
+            
+            for start in range(0, len(window), batch_size):
+                batch = window[start:start + batch_size]
+                job["written_ids"].extend(chunk["chunk_id"] for chunk in batch if chunk["chunk_id"] in new_ids)
+                job["moved_indexes"].update(
+                    (chunk["chunk_id"], previous_indexes[chunk["chunk_id"]])
+                    for chunk in batch if chunk["chunk_id"] in previous_indexes
+                )
+                result = await run_in_threadpool(vectorstore.add_documents, batch)
+                write_errors.update(result["errors"])
+                for key in written:
+                    written[key] += result[key]
+                seconds = written["seconds"]
+                self._update(
+                    job,
+                    chunks_stored=written["stored"],
+                    chunks_failed=len(write_errors),
+                    write_objects_per_second=round(written["stored"] / seconds, 1) if seconds else 0.0,
+                    write_bytes_per_second=round(written["bytes"] / seconds, 1) if seconds else 0.0
+                )
+            
+            for chunk in window:
+                del chunk["vector"]
+        
+        completed = []
+        for (document, _), plan in zip(ready, plans):
+            failed_chunks = [chunk for chunk in plan["new"] + plan["moved"] if chunk["chunk_id"] in write_errors]
+            if failed_chunks:
+                await self._reject(job, document, plan, failed_chunks, write_errors)
+                continue
+            
+            # Stale chunks go last so the previous version stays searchable until now
+            if plan["stale"]:
+                await run_in_threadpool(vectorstore.delete_chunks, plan["stale"])
+            document["status"] = "completed"
+            completed.append(plan)
+        
+        if not completed:
+            raise RuntimeError(f"Failed to store {len(write_errors)} chunks in vector database")
+        
+        failed = len(documents) - len(completed)
+        self._update(
+            job,
+            status="completed_with_errors" if failed else "completed",
+            chunks_unchanged=sum(len(plan["unchanged"]) for plan in completed),
+            chunks_deleted=sum(len(plan["stale"]) for plan in completed)
+        )
+        logger.info(
+            f"Ingestion job {job['job_id']} completed: {len(completed)} documents, "
+            f"{written['stored']} new chunks, {job['chunks_unchanged']} unchanged, "
+            f"{job['chunks_deleted']} deleted, {failed} failed"
+        )
+    
+    async def _rollback(self, job: Dict[str, Any]):
+        """Undo a failed job's writes, restoring each document's previous version
+        
+        New chunks are deleted; stored chunks the job moved get their old chunk_index back.
+        """
+        try:
+            if job["written_ids"]:
+                await run_in_threadpool(vectorstore.delete_chunks, job["written_ids"])
+            if job["moved_indexes"]:
+                await run_in_threadpool(vectorstore.set_chunk_indexes, job["moved_indexes"])
+        except Exception as e:
+            logger.error(f"Rollback of ingestion job {job['job_id']} failed: {e}")
+    
+    @asynccontextmanager
+    async def _lock_documents(self, document_ids: List[str]) -> AsyncIterator[None]:
+        """Hold the ingestion lock of every document, taken in sorted order to avoid deadlocks"""
+        document_ids = sorted(set(document_ids))
+        for document_id in document_ids:
+            lock, users = self._document_locks.get(document_id, (asyncio.Lock(), 0))
+            self._document_locks[document_id] = (lock, users + 1)
+        
+        acquired = []
+        try:
+            for document_id in document_ids:
+                lock = self._document_locks[document_id][0]
+                await lock.acquire()
+                acquired.append(lock)
+            yield
+        finally:
+            for lock in acquired:
+                lock.release()
+            for document_id in document_ids:
+                lock, users = self._document_locks[document_id]
+                if users == 1:
+                    del self._document_locks[document_id]
+                else:
+                    self._document_locks[document_id] = (lock, users - 1)
+    
+    async def _reject(self, job: Dict[str, Any], document: Dict[str, Any], plan: Dict[str, Any],
+                      failed_chunks: List[Dict[str, Any]], write_errors: Dict[str, str]):
+        """Fail a document whose chunks could not all be stored, keeping its previous version"""
+        stored_ids = [chunk["chunk_id"] for chunk in plan["new"] if chunk["chunk_id"] not in write_errors]
+        if stored_ids:
+            await run_in_threadpool(vectorstore.delete_chunks, stored_ids)
+        moved_indexes = {
+            chunk_id: chunk_index for chunk_id, chunk_index in plan["previous_indexes"].items()
+            if chunk_id not in write_errors
+        }
+        if moved_indexes:
+            await run_in_threadpool(vectorstore.set_chunk_indexes, moved_indexes)
+        
+        self._update_document(
+            job,
+            document,
+            status="failed",
+            error=f"{len(failed_chunks)} chunks failed to store: {write_errors[failed_chunks[0]['chunk_id']]}",
+            write_errors=[
+                {"chunk_index": chunk["chunk_index"], "error": write_errors[chunk["chunk_id"]]}
+                for chunk in failed_chunks[:MAX_REPORTED_WRITE_ERRORS]
+            ]
+        )
+    
+    def _plan(self, job: Dict[str, Any], document: Dict[str, Any],
+              chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Diff a document's chunks against the version already stored"""
+        stored = vectorstore.get_chunk_indexes(document["document_id"])
+        current = {chunk["chunk_id"] for chunk in chunks}
+        plan = {
+            "new": [chunk for chunk in chunks if chunk["chunk_id"] not in stored],
+            "unchanged": [chunk for chunk in chunks if chunk["chunk_id"] in stored],
+            "stale": [chunk_id for chunk_id in stored if chunk_id not in current]
+        }
+        plan["moved"] = [
+            chunk for chunk in plan["unchanged"]
+            if stored[chunk["chunk_id"]] != chunk["chunk_index"]
+        ]
+        # Kept so a failed write can move them back
+        plan["previous_indexes"] = {chunk["chunk_id"]: stored[chunk["chunk_id"]] for chunk in plan["moved"]}
+        self._update_document(
+            job,
+            document,
+            chunks_new=len(plan["new"]),
+            chunks_unchanged=len(plan["unchanged"]),
+            chunks_deleted=len(plan["stale"])
+        )
+        return plan
+    
+    async def _prepare(self, job: Dict[str, Any], document: Dict[str, Any],
+                       slots: asyncio.Semaphore) -> List[Dict[str, Any]]:
+        """Extract and chunk one document of a job"""
+        if document["status"] == "failed":
+            return []
+        async with slots:
+            document["status"] = "processing"
+            try:
+                # Progress callbacks come back from the worker thread and only
+                # touch plain counters
+                chunks = await run_in_threadpool(
+                    document_processor.prepare_chunks,
+                    document["file_path"],
+                    document["filename"],
+                    document["document_id"],
+                    lambda **counters: self._update_document(job, document, **counters)
+                )
+            except Exception as e:
+                logger.error(f"Error extracting {document['filename']} in job {job['job_id']}: {e}")
+                self._update_document(job, document, status="failed", error=str(e))
+                return []
+
+            self._update_document(job, document, status="extracted")
+            return chunks
+
+    def _update(self, job: Dict[str, Any], **fields):
+        job.update(fields)
+        job["updated_at"] = datetime.now()
+        self._save(job, force="status" in fields)
+
+    def _update_document(self, job: Dict[str, Any], document: Dict[str, Any], **fields):
+        document.update(fields)
+        job["updated_at"] = datetime.now()
+        self._save(job)
+
+    def _save(self, job: Dict[str, Any], force: bool = True):
+        # Every save rewrites the whole record, documents included, so
+        # per-chunk progress is written at most every INGEST_JOB_SAVE_INTERVAL;
+        # this worker's own polls read the live record in memory
+        now = time.monotonic()
+        if not force and now - job["saved_at"] < settings.INGEST_JOB_SAVE_INTERVAL:
+            return
+        job["saved_at"] = now
+        self.store.save(self._public(job))
+
+    def _cleanup(self, job: Dict[str, Any]):
+        for document in job["documents"]:
+            file_path = document.get("file_path")
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+
+    def _trim_history(self):
+        # Forget the oldest finished jobs; queued and running ones are kept
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in FINISHED_STATUSES]
+        excess = len(self._jobs) - self.history_size
+        for job_id in finished[:max(excess, 0)]:
+            del self._jobs[job_id]
+            self.store.delete(job_id)
+
+    @staticmethod
+    def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+        documents = [
+            {key: value for key, value in document.items() if key != "file_path"}
+            for document in job["documents"]
+        ]
+        # Single-document jobs also expose the document at the top level
+        single = documents[0] if len(documents) == 1 else {}
+        return {
+            **{key: value for key, value in job.items() if key not in ("documents", "written_ids", "moved_indexes", "saved_at")},
+            "document_id": single.get("document_id"),
+            "filename": single.get("filename"),
+            "documents_total": len(documents),
+            "documents_failed": sum(1 for d in documents if d["status"] == "failed"),
+            "pages_extracted": sum(d["pages_extracted"] for d in documents),
+            "chunks_total": sum(d["chunks_total"] for d in documents),
+            "chunks_truncated": sum(d["chunks_truncated"] for d in documents),
+            "tokens_truncated": sum(d["tokens_truncated"] for d in documents),
+            "documents": documents
+        }
+
+# Global instance
+ingestion_jobs = IngestionJobManager(
+    workers=settings.INGEST_WORKERS,
+    max_queue_size=settings.INGEST_QUEUE_SIZE,
+    history_size=settings.INGEST_JOB_HISTORY,
+    store=JobStore(settings.INGEST_JOB_DIR)
+)
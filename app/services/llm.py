@@ -1,27 +1,251 @@
 import httpx
 import json
+import asyncio
 import logging
-from typing import Dict, Any, Optional
+from contextlib import aclosing
+from typing import Dict, Any, Optional, AsyncIterator
 from app.config import settings
+from app.services.dispatch import llm_dispatcher
+from app.services.resilience import CircuitBreaker, RETRYABLE_STATUSES, backoff_delay, parse_retry_after
 
 logger = logging.getLogger(__name__)
 
+# Ping responses that mean calls would fail even though the service answered
+UNHEALTHY_PING_STATUSES = (401, 403, 404)
+
+class LLMStreamTruncated(Exception):
+    """Raised when a stream that already produced text ends before the provider's [DONE]"""
+
 class SaptivaLLMClient:
     def __init__(self):
         self.api_key = settings.SAPTIVA_API_KEY
         self.api_url = settings.SAPTIVA_API_URL
-        self.timeout = 30.0
+        self.timeout = httpx.Timeout(
+            settings.LLM_TIMEOUT,
+            connect=settings.LLM_CONNECT_TIMEOUT,
+            read=settings.LLM_READ_TIMEOUT
+        )
+        self.breaker = CircuitBreaker(
+            "saptiva",
+            window=settings.LLM_BREAKER_WINDOW,
+            min_calls=settings.LLM_BREAKER_MIN_CALLS,
+            failure_rate=settings.LLM_BREAKER_FAILURE_RATE,
+            cooldown=settings.LLM_BREAKER_COOLDOWN
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    async def start(self):
+        """Open the pooled HTTP client used for every Saptiva call"""
+        if self._client is not None:
+            return
+        
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            http2=settings.LLM_HTTP2,
+            limits=httpx.Limits(
+                max_connections=settings.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY
+            ),
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }
+        )
+        logger.info(f"Saptiva OPS client started (http2={settings.LLM_HTTP2})")
     
-    def generate_response(self, prompt: str, context: str = "") -> Optional[str]:
-        """Generate a response using Saptiva OPS API"""
+    async def close(self):
+        """Close the pooled HTTP client"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Return the pooled client, starting it on first use"""
+        if self._client is None:
+            await self.start()
+        return self._client
+    
+    async def generate_response(self, prompt: str, context: str = "",
+                                priority: str = "interactive") -> Optional[str]:
+        """Generate a response using Saptiva OPS API
+        
+        Returns None when the call fails or the circuit is open. Raises
+        LLMOverloaded when no call slot frees up in time.
+        """
         if not self.api_key:
             logger.error("Saptiva API key not configured")
             return None
         
+        payload = self._build_payload(prompt, context)
+        
+        # The breaker is asked only once a slot is held, so a call shed by the
+        # dispatcher never claims the half-open trial and leaves it unreported
+        async with llm_dispatcher.slot(priority):
+            if not self.breaker.allow():
+                logger.warning("Saptiva OPS circuit is open; skipping the LLM call")
+                return None
+            return await self._complete(payload)
+    
+    async def _complete(self, payload: Dict[str, Any]) -> Optional[str]:
+        """Send a chat completion request, retrying transient failures, and return the answer text"""
+        attempt = 0
+        while True:
+            retry_after = None
+            try:
+                client = await self._get_client()
+                response = await client.post(self.api_url, json=payload)
+                if response.status_code not in RETRYABLE_STATUSES:
+                    self.breaker.record(True)
+                    response.raise_for_status()
+                    
+                    result = response.json()
+                    
+                    if "choices" in result and len(result["choices"]) > 0:
+                        content = result["choices"][0]["message"]["content"]
+                        logger.info("Successfully generated response from Saptiva OPS")
+                        return content
+                    else:
+                        logger.error(f"Unexpected response format: {result}")
+                        return None
+                
+                self.breaker.record(False)
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                error = f"HTTP {response.status_code} - {response.text[:200]}"
+                
+            except httpx.HTTPStatusError as e:
+                logger.error(f"HTTP error calling Saptiva OPS: {e.response.status_code} - {e.response.text}")
+                return None
+            except httpx.TransportError as e:
+                self.breaker.record(False)
+                error = repr(e)
+            except Exception as e:
+                logger.error(f"Unexpected error calling Saptiva OPS: {e}")
+                return None
+            
+            if not await self._wait_to_retry(attempt, retry_after, error):
+                return None
+            attempt += 1
+    
+    async def stream_response(self, prompt: str, context: str = "",
+                              priority: str = "interactive") -> AsyncIterator[str]:
+        """Stream response tokens from Saptiva OPS as they are generated
+        
+        The call slot is held until the stream ends; raises LLMOverloaded
+        before the first token when no slot frees up in time. Yields nothing
+        when the circuit is open, and raises LLMStreamTruncated when the
+        stream breaks off after yielding part of the answer.
+        """
+        if not self.api_key:
+            logger.error("Saptiva API key not configured")
+            return
+        
+        payload = self._build_payload(prompt, context, stream=True)
+        
+        async with llm_dispatcher.slot(priority):
+            if not self.breaker.allow():
+                logger.warning("Saptiva OPS circuit is open; skipping the LLM call")
+                return
+            async with aclosing(self._stream(payload)) as stream:
+                async for delta in stream:
+                    yield delta
+    
+    async def _stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """Send a streaming chat completion request and yield the deltas
+        
+        Failures before the first delta are retried like _complete; once
+        text has been yielded the stream cannot be replayed, so any failure,
+        including a body that ends without [DONE], raises LLMStreamTruncated.
+        """
+        attempt = 0
+        started = False
+        while True:
+            retry_after = None
+            try:
+                client = await self._get_client()
+                async with client.stream("POST", self.api_url, json=payload) as response:
+                    if response.status_code in RETRYABLE_STATUSES:
+                        await response.aread()
+                        self.breaker.record(False)
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        error = f"HTTP {response.status_code} - {response.text[:200]}"
+                    elif response.is_error:
+                        await response.aread()
+                        self.breaker.record(True)
+                        logger.error(f"HTTP error streaming from Saptiva OPS: {response.status_code} - {response.text}")
+                        return
+                    else:
+                        completed = False
+                        async for line in response.aiter_lines():
+                            # Server-sent events from the provider: "data: {...}" per delta
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[len("data:"):].strip()
+                            if data == "[DONE]":
+                                completed = True
+                                break
+                            
+                            delta = self._extract_delta(json.loads(data))
+                            if delta:
+                                started = True
+                                yield delta
+                        
+                        if not completed:
+                            raise httpx.RemoteProtocolError("Stream ended without [DONE]")
+                        self.breaker.record(True)
+                        logger.info("Successfully streamed response from Saptiva OPS")
+                        return
+                
+            except httpx.TransportError as e:
+                self.breaker.record(False)
+                if started:
+                    logger.error(f"Stream from Saptiva OPS broke off: {e}")
+                    raise LLMStreamTruncated(str(e)) from e
+                error = repr(e)
+            except Exception as e:
+                self.breaker.record(False)
+                logger.error(f"Unexpected error streaming from Saptiva OPS: {e}")
+                if started:
+                    raise LLMStreamTruncated(str(e)) from e
+                return
+            
+            if not await self._wait_to_retry(attempt, retry_after, error):
+                return
+            attempt += 1
+    
+    async def _wait_to_retry(self, attempt: int, retry_after: Optional[float], error: str) -> bool:
+        """Sleep before the next attempt; False when the call should give up instead"""
+        if attempt >= settings.LLM_MAX_RETRIES:
+            logger.error(f"Saptiva OPS call failed after {attempt + 1} attempts: {error}")
+            return False
+        if retry_after is not None and retry_after > settings.LLM_RETRY_AFTER_MAX:
+            logger.error(f"Saptiva OPS asked to retry after {retry_after:.0f}s; giving up: {error}")
+            return False
+        if not self.breaker.allow():
+            logger.error(f"Saptiva OPS circuit opened; not retrying: {error}")
+            return False
+        
+        delay = backoff_delay(attempt, settings.LLM_BACKOFF_BASE, settings.LLM_BACKOFF_MAX)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        logger.warning(f"Saptiva OPS attempt {attempt + 1} failed ({error}); retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+        return True
+    
+    def _extract_delta(self, event: Dict[str, Any]) -> str:
+        """Extract the text delta from a streamed completion event"""
+        choices = event.get("choices") or []
+        if not choices:
+            return ""
+        choice = choices[0]
+        delta = choice.get("delta") or choice.get("message") or {}
+        return delta.get("content") or ""
+    
+    def _build_payload(self, prompt: str, context: str, stream: bool = False) -> Dict[str, Any]:
+        """Build the chat completion request payload"""
         # Build the full prompt with context
         full_prompt = self._build_prompt(prompt, context)
         
-        # Prepare the request payload
         payload = {
             "model": "gpt-3.5-turbo",  # Adjust based on Saptiva's available models
             "messages": [
@@ -37,40 +261,9 @@ class SaptivaLLMClient:
             "max_tokens": 1000,
             "temperature": 0.7
         }
-        
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        try:
-            with httpx.Client(timeout=self.timeout) as client:
-                response = client.post(
-                    self.api_url,
-                    headers=headers,
-                    json=payload
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                
-                if "choices" in result and len(result["choices"]) > 0:
-                    content = result["choices"][0]["message"]["content"]
-                    logger.info("Successfully generated response from Saptiva OPS")
-                    return content
-                else:
-                    logger.error(f"Unexpected response format: {result}")
-                    return None
-                    
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error calling Saptiva OPS: {e.response.status_code} - {e.response.text}")
-            return None
-        except httpx.RequestError as e:
-            logger.error(f"Request error calling Saptiva OPS: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"Unexpected error calling Saptiva OPS: {e}")
-            return None
+        if stream:
+            payload["stream"] = True
+        return payload
     
     def _build_prompt(self, question: str, context: str) -> str:
         """Build the full prompt with context"""
@@ -86,12 +279,37 @@ Por favor, responde la pregunta basándote en el contexto proporcionado. Si el c
 
 Por favor, proporciona una respuesta médica profesional. Si no tienes suficiente información para responder completamente, indica qué información adicional necesitas."""
     
-    def test_connection(self) -> bool:
-        """Test the connection to Saptiva OPS API"""
+    async def ping(self, timeout: float) -> bool:
+        """Check that Saptiva OPS is reachable and accepts our key, without running a completion"""
+        if not self.api_key:
+            return False
+        try:
+            client = await self._get_client()
+            # A GET on the completions endpoint is rejected cheaply (e.g. 405).
+            # 5xx means the service is down; 401/403 a rejected key and 404 a
+            # wrong URL, so completions would fail too
+            response = await client.get(self.api_url, timeout=timeout)
+            if response.status_code >= 500 or response.status_code in UNHEALTHY_PING_STATUSES:
+                logger.error(f"Saptiva OPS ping answered HTTP {response.status_code}")
+                return False
+            return True
+        except Exception as e:
+            logger.error(f"Saptiva OPS ping failed: {e}")
+            return False
+    
+    async def test_connection(self) -> bool:
+        """Test the connection to Saptiva OPS API with a one-token completion"""
+        if not self.api_key:
+            logger.error("Saptiva API key not configured")
+            return False
+        
+        payload = self._build_payload("Test connection", "")
+        payload["max_tokens"] = 1
         try:
-            test_prompt = "Test connection"
-            response = self.generate_response(test_prompt)
-            return response is not None
+            client = await self._get_client()
+            response = await client.post(self.api_url, json=payload)
+            response.raise_for_status()
+            return bool(response.json().get("choices"))
         except Exception as e:
             logger.error(f"Connection test failed: {e}")
             return False
@@ -1,57 +1,93 @@
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
-from sentence_transformers import SentenceTransformer
+from contextlib import aclosing
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
+from fastapi.concurrency import run_in_threadpool
+from app.services.cache import answer_cache
+from app.services.context import pack_context
+from app.services.diversify import remove_near_duplicates
+from app.services.embeddings import embedding_service
 from app.services.vectorstore import vectorstore
-from app.services.llm import llm_client
+from app.services.llm import llm_client, LLMStreamTruncated
+from app.services.dispatch import LLMOverloaded
 from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+NO_RESULTS_ANSWER = "No encontré información relevante en los documentos disponibles para responder tu pregunta."
+# Degraded mode: the LLM failed or its circuit is open, so only the sources are returned
+DEGRADED_ANSWER = ("Lo siento, no pude generar una respuesta en este momento. "
+                   "Estas son las fuentes más relevantes encontradas para tu pregunta.")
+
 class RAGPipeline:
     def __init__(self):
-        self.embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
+        self.embedding_service = embedding_service
+        self._query_slots = asyncio.Semaphore(settings.MAX_CONCURRENT_QUERIES)
         logger.info(f"RAG pipeline initialized with model: {settings.EMBEDDING_MODEL}")
     
-    def query(self, question: str, max_results: int = 5) -> Dict[str, Any]:
-        """Process a query through the RAG pipeline"""
+    async def query(self, question: str, max_results: int = 5, search_mode: Optional[str] = None,
+                    alpha: Optional[float] = None, min_similarity: Optional[float] = None,
+                    priority: str = "interactive") -> Dict[str, Any]:
+        """Process a query through the RAG pipeline
+        
+        Raises LLMOverloaded when the LLM call is shed. ``MAX_CONCURRENT_QUERIES``
+        bounds only retrieval; the LLM call is admitted by the dispatcher so
+        its queue sees the real load and can shed it.
+        """
         try:
-            # Generate embedding for the question
-            question_embedding = self.embedding_model.encode([question])[0].tolist()
-            
-            # Retrieve relevant chunks
-            relevant_chunks = vectorstore.search_similar(
-                query_vector=question_embedding,
-                limit=max_results
-            )
-            
-            if not relevant_chunks:
-                logger.warning("No relevant chunks found for query")
-                return {
-                    "answer": "No encontré información relevante en los documentos disponibles para responder tu pregunta.",
-                    "sources": [],
-                    "query": question
-                }
+            search_mode, alpha = self._search_params(search_mode, alpha)
+            min_similarity = self._min_similarity(min_similarity)
+            variant = self._cache_variant(max_results, search_mode, alpha, min_similarity)
+            corpus_version = vectorstore.corpus_version
             
-            # Build context from retrieved chunks
-            context = self._build_context(relevant_chunks)
+            async with self._query_slots:
+                cached, question_embedding = await self._lookup_cache(question, variant, corpus_version)
+                if cached is not None:
+                    return {**cached, "query": question, "context_tokens": 0}
+                
+                relevant_chunks = await self._retrieve(question, question_embedding, max_results,
+                                                       search_mode, alpha, min_similarity)
+                
+                # Nothing cleared the similarity cutoff: answer without calling the LLM
+                if not relevant_chunks:
+                    logger.warning("No relevant chunks found for query")
+                    return {
+                        "answer": NO_RESULTS_ANSWER,
+                        "sources": [],
+                        "query": question,
+                        "context_tokens": 0
+                    }
+                
+                # Build context from retrieved chunks, within the token budget
+                context, context_tokens, relevant_chunks = await run_in_threadpool(
+                    self._build_context, relevant_chunks
+                )
             
             # Generate response using LLM
-            answer = llm_client.generate_response(question, context)
-            
-            if not answer:
-                answer = "Lo siento, no pude generar una respuesta en este momento. Por favor, intenta de nuevo."
+            answer = await llm_client.generate_response(question, context, priority)
             
             # Prepare sources
             sources = self._prepare_sources(relevant_chunks)
             
-            logger.info(f"Successfully processed query: {len(relevant_chunks)} chunks retrieved")
+            degraded = not answer
+            if degraded:
+                logger.warning("LLM unavailable; answering in degraded mode with sources only")
+                answer = DEGRADED_ANSWER
+            else:
+                self._store_cache(question, question_embedding, variant, answer, sources, corpus_version)
+            
+            logger.info(f"Successfully processed query: {len(relevant_chunks)} chunks, {context_tokens} context tokens")
             
             return {
                 "answer": answer,
                 "sources": sources,
-                "query": question
+                "query": question,
+                "context_tokens": context_tokens,
+                "degraded": degraded
             }
             
+        except LLMOverloaded:
+            raise
         except Exception as e:
             logger.error(f"Error in RAG pipeline: {e}")
             return {
@@ -60,17 +96,193 @@ class RAGPipeline:
                 "query": question
             }
     
-    def _build_context(self, chunks: List[Dict[str, Any]]) -> str:
-        """Build context string from retrieved chunks"""
-        context_parts = []
-        
-        for i, chunk in enumerate(chunks, 1):
-            source_info = f"Fuente {i}: {chunk['filename']} (fragmento {chunk['chunk_index']})"
-            content = chunk['content']
+    async def query_stream(self, question: str, max_results: int = 5, search_mode: Optional[str] = None,
+                           alpha: Optional[float] = None, min_similarity: Optional[float] = None,
+                           priority: str = "interactive") -> AsyncIterator[Dict[str, Any]]:
+        """Process a query and yield sources, answer tokens and a final done event"""
+        try:
+            search_mode, alpha = self._search_params(search_mode, alpha)
+            min_similarity = self._min_similarity(min_similarity)
+            variant = self._cache_variant(max_results, search_mode, alpha, min_similarity)
+            corpus_version = vectorstore.corpus_version
+            
+            # Only retrieval holds a query slot; the LLM stage queues in the dispatcher
+            async with self._query_slots:
+                cached, question_embedding = await self._lookup_cache(question, variant, corpus_version)
+                relevant_chunks, context, context_tokens = [], "", 0
+                if cached is None:
+                    relevant_chunks = await self._retrieve(question, question_embedding, max_results,
+                                                           search_mode, alpha, min_similarity)
+                    if relevant_chunks:
+                        context, context_tokens, relevant_chunks = await run_in_threadpool(
+                            self._build_context, relevant_chunks
+                        )
+            
+            if cached is not None:
+                yield {"event": "sources", "data": {"sources": cached["sources"], "query": question, "context_tokens": 0}}
+                yield {"event": "token", "data": {"text": cached["answer"]}}
+                yield {"event": "done", "data": {"query": question}}
+                return
+            
+            sources = self._prepare_sources(relevant_chunks)
+            
+            # Sources go out first so the client can render them before the answer
+            yield {"event": "sources", "data": {"sources": sources, "query": question, "context_tokens": context_tokens}}
+            
+            if not relevant_chunks:
+                logger.warning("No relevant chunks found for query")
+                yield {"event": "token", "data": {"text": NO_RESULTS_ANSWER}}
+                yield {"event": "done", "data": {"query": question}}
+                return
+            
+            tokens = []
+            truncated = False
+            try:
+                # Closed explicitly so a consumer that stops early frees the call slot at once
+                async with aclosing(llm_client.stream_response(question, context, priority)) as stream:
+                    async for token in stream:
+                        tokens.append(token)
+                        yield {"event": "token", "data": {"text": token}}
+            except LLMStreamTruncated:
+                truncated = True
+            
+            degraded = not tokens or truncated
+            if truncated:
+                # The partial answer already went out; it is never cached as if complete
+                logger.warning("LLM stream broke off; answer is incomplete and will not be cached")
+            elif degraded:
+                logger.warning("LLM unavailable; answering in degraded mode with sources only")
+                yield {"event": "token", "data": {"text": DEGRADED_ANSWER}}
+            else:
+                self._store_cache(question, question_embedding, variant, "".join(tokens), sources, corpus_version)
             
-            context_parts.append(f"{source_info}\n{content}\n")
+            logger.info(f"Successfully streamed query: {len(relevant_chunks)} chunks, {context_tokens} context tokens")
+            yield {"event": "done", "data": {"query": question, "degraded": degraded, "truncated": truncated}}
+            
+        except LLMOverloaded as e:
+            yield {"event": "error", "data": {"detail": str(e), "status": 503, "retry_after": e.retry_after}}
+        except Exception as e:
+            logger.error(f"Error in RAG streaming pipeline: {e}")
+            yield {"event": "error", "data": {"detail": f"Error procesando la consulta: {str(e)}"}}
+    
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return answer and question-embedding cache statistics"""
+        return {
+            "answers": {"enabled": settings.ANSWER_CACHE_ENABLED, **answer_cache.stats()},
+            "embeddings": self.embedding_service.cache_stats()
+        }
+    
+    async def _lookup_cache(self, question: str, variant: str, corpus_version: int) -> Tuple[Optional[Dict[str, Any]], List[float]]:
+        """Check the answer cache, embedding the question only when needed"""
+        if settings.ANSWER_CACHE_ENABLED:
+            # Exact hits skip the embedding step entirely
+            cached = answer_cache.get_exact(question, variant, corpus_version)
+            if cached is not None:
+                logger.info("Answer cache hit (exact)")
+                return cached, []
+        
+        # Generate embedding for the question off the event loop; every
+        # search mode but keyword needs it, and the semantic cache always does
+        question_embedding = await self.embedding_service.aencode_one(question)
+        
+        if settings.ANSWER_CACHE_ENABLED:
+            cached = answer_cache.get_semantic(question_embedding, variant, corpus_version)
+            if cached is not None:
+                logger.info("Answer cache hit (semantic)")
+                return cached, question_embedding
+        
+        return None, question_embedding
+    
+    def _store_cache(self, question: str, question_embedding: List[float], variant: str,
+                     answer: str, sources: List[Dict[str, Any]], corpus_version: int):
+        """Remember a generated answer for similar future questions"""
+        if settings.ANSWER_CACHE_ENABLED:
+            answer_cache.put(
+                question,
+                question_embedding,
+                variant,
+                {"answer": answer, "sources": sources},
+                corpus_version
+            )
+    
+    def _search_params(self, search_mode: Optional[str], alpha: Optional[float]) -> Tuple[str, Optional[float]]:
+        """Fill in the configured defaults; alpha only applies to hybrid search"""
+        search_mode = search_mode or settings.SEARCH_MODE
+        if search_mode != "hybrid":
+            return search_mode, None
+        return search_mode, settings.HYBRID_ALPHA if alpha is None else alpha
+    
+    def _min_similarity(self, min_similarity: Optional[float]) -> float:
+        """Fill in the configured similarity cutoff"""
+        return settings.MIN_SIMILARITY if min_similarity is None else min_similarity
+    
+    def _cache_variant(self, max_results: int, search_mode: str, alpha: Optional[float],
+                       min_similarity: float = 0.0) -> str:
+        """Request parameters that change the answer and so partition the cache"""
+        variant = f"k={max_results}|mode={search_mode}"
+        if alpha is not None:
+            variant = f"{variant}|alpha={alpha}"
+        return variant if not min_similarity else f"{variant}|min_sim={min_similarity}"
+    
+    async def _retrieve(self, question: str, question_embedding: List[float], max_results: int,
+                        search_mode: str, alpha: Optional[float],
+                        min_similarity: float = 0.0) -> List[Dict[str, Any]]:
+        """Fetch the ``max_results`` most relevant chunks, without near-duplicates
+        
+        Over-fetches DEDUP_CANDIDATE_MULTIPLIER times as many chunks so the
+        result stays at ``max_results`` after duplicates are dropped.
+        """
+        if not settings.DEDUP_ENABLED:
+            return await self._search(question, question_embedding, max_results, search_mode, alpha, min_similarity)
+        
+        candidates = max_results * settings.DEDUP_CANDIDATE_MULTIPLIER
+        chunks = await self._search(question, question_embedding, candidates, search_mode, alpha, min_similarity)
+        distinct = remove_near_duplicates(chunks, settings.DEDUP_SIMILARITY)
+        if len(distinct) < len(chunks):
+            logger.info(f"Dropped {len(chunks) - len(distinct)} near-duplicate chunks of {len(chunks)}")
+        return distinct[:max_results]
+    
+    async def _search(self, question: str, question_embedding: List[float], max_results: int,
+                      search_mode: str, alpha: Optional[float], min_similarity: float) -> List[Dict[str, Any]]:
+        """Fetch the chunks most relevant to the question with the requested search mode
+        
+        ``min_similarity`` bounds the cosine similarity of each chunk to the
+        question, as a distance cutoff: applied by Weaviate for vector search
+        and the vector side of RRF, and to the result vectors for hybrid and
+        keyword search and the keyword side of RRF.
+        """
+        max_distance = 1.0 - min_similarity if min_similarity else None
+        if search_mode == "hybrid":
+            return await vectorstore.search_hybrid(question, question_embedding, max_results, alpha, max_distance)
+        if search_mode == "keyword":
+            chunks = await vectorstore.search_keyword(question, max_results, question_embedding, max_distance)
+            # BM25 scores are unbounded; report them relative to the best match
+            top = max((chunk["score"] for chunk in chunks), default=0) or 1.0
+            return [{**chunk, "score": chunk["score"] / top} for chunk in chunks]
+        if search_mode == "rrf":
+            candidates = max_results * settings.RRF_CANDIDATE_MULTIPLIER
+            rankings = await asyncio.gather(
+                vectorstore.search_similar(question_embedding, candidates, max_distance),
+                vectorstore.search_keyword(question, candidates, question_embedding, max_distance)
+            )
+            return reciprocal_rank_fusion(rankings, settings.RRF_K)[:max_results]
+        return await vectorstore.search_similar(
+            query_vector=question_embedding,
+            limit=max_results,
+            max_distance=max_distance
+        )
+    
+    def _build_context(self, chunks: List[Dict[str, Any]]) -> Tuple[str, int, List[Dict[str, Any]]]:
+        """Build context string from retrieved chunks within CONTEXT_TOKEN_BUDGET
         
-        return "\n".join(context_parts)
+        Returns the context, its token count and the chunks that made it in.
+        """
+        context, tokens, packed = pack_context(
+            chunks, settings.CONTEXT_TOKEN_BUDGET, self.embedding_service.count_tokens
+        )
+        if len(packed) < len(chunks):
+            logger.info(f"Context budget kept {len(packed)} of {len(chunks)} chunks ({tokens} tokens)")
+        return context, tokens, packed
     
     def _prepare_sources(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Prepare source information for the response"""
@@ -81,7 +293,8 @@ class RAGPipeline:
                 "filename": chunk['filename'],
                 "chunk_index": chunk['chunk_index'],
                 "content_preview": chunk['content'][:200] + "..." if len(chunk['content']) > 200 else chunk['content'],
-                "relevance_score": 1 - chunk.get('distance', 0),  # Convert distance to similarity score
+                # Fused/BM25 scores when present, otherwise distance converted to similarity
+                "relevance_score": chunk['score'] if 'score' in chunk else 1 - chunk.get('distance', 0),
                 "document_id": chunk['document_id']
             }
             sources.append(source)
@@ -91,9 +304,10 @@ class RAGPipeline:
     def get_document_summary(self, document_id: str) -> Dict[str, Any]:
         """Get summary information about a document"""
         try:
-            chunks = vectorstore.get_document_chunks(document_id)
+            # Aggregates only; no chunk content crosses the wire
+            stats = vectorstore.get_document_stats(document_id)
             
-            if not chunks:
+            if not stats["total_chunks"]:
                 return {
                     "document_id": document_id,
                     "total_chunks": 0,
@@ -101,18 +315,11 @@ class RAGPipeline:
                     "status": "not_found"
                 }
             
-            # Get basic info from first chunk
-            first_chunk = chunks[0]
-            filename = first_chunk['filename']
-            
-            # Calculate total content length
-            total_content_length = sum(len(chunk['content']) for chunk in chunks)
-            
             return {
                 "document_id": document_id,
-                "filename": filename,
-                "total_chunks": len(chunks),
-                "total_content_length": total_content_length,
+                "filename": stats["filename"],
+                "total_chunks": stats["total_chunks"],
+                "total_content_length": stats["total_content_length"],
                 "status": "available"
             }
             
@@ -124,6 +331,24 @@ class RAGPipeline:
                 "error": str(e)
             }
 
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int) -> List[Dict[str, Any]]:
+    """Merge ranked chunk lists by summing 1 / (k + rank) per chunk
+    
+    The fused score is normalized so the best possible chunk (first in every
+    list) scores 1.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, 1):
+            key = chunk.get("chunk_id") or f"{chunk['document_id']}:{chunk['chunk_index']}"
+            fused.setdefault(key, chunk)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    
+    best = len(rankings) / (k + 1)
+    ordered = sorted(scores, key=scores.get, reverse=True)
+    return [{**fused[key], "score": scores[key] / best} for key in ordered]
+
 # Global instance
 rag_pipeline = RAGPipeline()
 
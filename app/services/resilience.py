@@ -0,0 +1,113 @@
+import time
+import random
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Deque, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Provider responses worth another attempt: rate limiting and server-side failures
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff before retry number ``attempt`` (0-based)"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+class CircuitBreaker:
+    """Fails calls fast while a dependency's recent error rate is too high
+
+    Closed: calls pass and their outcomes fill a window of the last
+    ``window`` attempts; once it holds ``min_calls`` outcomes with a failure
+    share of at least ``failure_rate`` the breaker opens. Open: calls are
+    rejected for ``cooldown`` seconds. Half-open: a single trial call is let
+    through; success closes the breaker, failure opens it again.
+    """
+
+    def __init__(self, name: str, window: int, min_calls: int, failure_rate: float, cooldown: float):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        self._counters = {"opened": 0, "rejected": 0}
+
+    def allow(self) -> bool:
+        """Whether a call may go out now; in half-open state only one may"""
+        if self.state == "open":
+            if time.monotonic() - self._opened_at < self.cooldown:
+                self._counters["rejected"] += 1
+                return False
+            self.state = "half_open"
+            self._trial_in_flight = False
+
+        if self.state == "half_open":
+            # A trial whose caller vanished without recording frees up after a cooldown
+            if self._trial_in_flight and time.monotonic() - self._trial_started < self.cooldown:
+                self._counters["rejected"] += 1
+                return False
+            self._trial_in_flight = True
+            self._trial_started = time.monotonic()
+        return True
+
+    def record(self, success: bool):
+        """Record the outcome of an allowed call"""
+        if self.state == "half_open":
+            self._trial_in_flight = False
+            if success:
+                self.state = "closed"
+                self._outcomes.clear()
+                logger.info(f"Circuit {self.name} closed")
+            else:
+                self._open()
+            return
+
+        self._outcomes.append(success)
+        failures = self._outcomes.count(False)
+        if (self.state == "closed" and len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_rate):
+            self._open()
+
+    def reset(self):
+        """Close the breaker and forget recent outcomes"""
+        self.state = "closed"
+        self._outcomes.clear()
+        self._trial_in_flight = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Return state, recent failure rate and counters"""
+        recent = len(self._outcomes)
+        return {
+            "state": self.state,
+            "recent_calls": recent,
+            "recent_failure_rate": self._outcomes.count(False) / recent if recent else 0.0,
+            **self._counters
+        }
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._counters["opened"] += 1
+        logger.warning(f"Circuit {self.name} opened; failing fast for {self.cooldown:.0f}s")
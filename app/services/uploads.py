@@ -0,0 +1,178 @@
+"""Streaming multipart uploads.
+
+File parts are parsed straight off ``request.stream()`` and written to
+UPLOAD_DIR as their bytes arrive, so an upload is copied once, memory
+holds one network block, and a size limit stops the copy as soon as it
+is crossed instead of after the whole body was buffered.
+"""
+import os
+import tempfile
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Tuple
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+from app.config import settings
+
+def multipart_files_body(field: str, many: bool = False) -> Dict[str, Any]:
+    """``openapi_extra`` documenting the file fields of an endpoint that parses the stream itself"""
+    file_schema = {"type": "string", "format": "binary"}
+    schema = {"type": "array", "items": file_schema} if many else file_schema
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {"type": "object", "required": [field], "properties": {field: schema}}
+                }
+            }
+        }
+    }
+
+class UploadTooLarge(Exception):
+    """Raised when an upload grows past the size limit while being received"""
+
+class InvalidMultipart(ValueError):
+    """Raised when the request body is not a well-formed multipart form"""
+
+class FilePart:
+    """One part of a multipart form whose body is read as it arrives"""
+
+    def __init__(self, stream: "MultipartStream", name: str, filename: Optional[str]):
+        self._stream = stream
+        self.name = name
+        self.filename = filename
+        self.consumed = False
+
+    async def blocks(self) -> AsyncIterator[bytes]:
+        """Yield the part's body in the blocks it arrives in"""
+        while not self.consumed:
+            kind, value = await self._stream._next_event()
+            if kind == "data":
+                yield value
+            elif kind == "part_end":
+                self.consumed = True
+            else:
+                raise InvalidMultipart(f"Unexpected {kind} inside part {self.name}")
+
+    async def discard(self):
+        """Skip whatever is left of the part's body"""
+        async for _ in self.blocks():
+            pass
+
+    async def save(self, suffix: str, max_bytes: Optional[int] = None) -> str:
+        """Write the part into a uniquely named file in UPLOAD_DIR and return its path
+
+        Raises UploadTooLarge, leaving no file behind, as soon as more than
+        ``max_bytes`` have arrived; the rest of the part is not read.
+        """
+        os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
+        fd, file_path = tempfile.mkstemp(suffix=suffix, prefix="upload-", dir=settings.UPLOAD_DIR)
+        written = 0
+        try:
+            with os.fdopen(fd, "wb") as buffer:
+                async for block in self.blocks():
+                    written += len(block)
+                    if max_bytes is not None and written > max_bytes:
+                        raise UploadTooLarge(f"{self.filename} exceeds {max_bytes} bytes")
+                    await run_in_threadpool(buffer.write, block)
+        except BaseException:
+            os.remove(file_path)
+            raise
+        return file_path
+
+class MultipartStream:
+    """Incremental multipart/form-data reader over ``request.stream()``
+
+    Iterate ``parts()`` and consume each part with ``save``, ``blocks`` or
+    ``discard``; a part left unread is skipped when the next one is requested.
+    """
+
+    def __init__(self, request: Request):
+        content_type, params = parse_options_header(request.headers.get("Content-Type", ""))
+        boundary = params.get(b"boundary")
+        if content_type != b"multipart/form-data" or not boundary:
+            raise InvalidMultipart("Expected a multipart/form-data body")
+        charset = params.get(b"charset", b"utf-8")
+        self._charset = charset.decode("latin-1") if isinstance(charset, bytes) else charset
+
+        self._body = request.stream()
+        self._events: Deque[Tuple[str, Any]] = deque()
+        self._finished = False
+        self._header_field = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": lambda: self._events.append(("part_end", None)),
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_end": lambda: self._events.append(("end", None))
+        })
+
+    async def parts(self) -> AsyncIterator[FilePart]:
+        """Yield the form's parts in order"""
+        part: Optional[FilePart] = None
+        while True:
+            if part is not None and not part.consumed:
+                await part.discard()
+            kind, value = await self._next_event()
+            if kind == "end":
+                return
+            if kind != "part":
+                raise InvalidMultipart(f"Unexpected {kind} between parts")
+            part = FilePart(self, *value)
+            yield part
+
+    async def _next_event(self) -> Tuple[str, Any]:
+        while not self._events:
+            if self._finished:
+                raise InvalidMultipart("Multipart body ended early")
+            try:
+                chunk = await self._body.__anext__()
+            except StopAsyncIteration:
+                self._finished = True
+                self._parser.finalize()
+                continue
+            try:
+                self._parser.write(chunk)
+            except MultipartParseError as e:
+                raise InvalidMultipart(f"Malformed multipart body: {e}")
+        return self._events.popleft()
+
+    def _decode(self, value: bytes) -> str:
+        try:
+            return value.decode(self._charset)
+        except (UnicodeDecodeError, LookupError):
+            return value.decode("latin-1")
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        self._events.append(("data", data[start:end]))
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        disposition, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if disposition != b"form-data" or b"name" not in options:
+            raise InvalidMultipart("Multipart part without a form-data Content-Disposition name")
+        filename = options.get(b"filename")
+        self._events.append((
+            "part",
+            (self._decode(options[b"name"]), self._decode(filename) if filename is not None else None)
+        ))
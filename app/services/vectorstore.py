@@ -1,14 +1,50 @@
+import json
+import time
+import httpx
 import weaviate
-from typing import List, Dict, Any, Optional
+import threading
+import numpy as np
+from weaviate.gql.get import HybridFusion
+from typing import List, Dict, Any, Optional, Iterator
 import logging
 from app.config import settings
+from app.services.corpus import SharedCounter
 
 logger = logging.getLogger(__name__)
 
+# Weaviate's default QUERY_MAXIMUM_RESULTS; also the cap of one batch delete
+MAX_QUERY_RESULTS = 10000
+
+CHUNK_PROPERTIES = ["content", "document_id", "filename", "chunk_index", "metadata"]
+
+# Properties added after the original schema; created on startup if missing
+ADDED_PROPERTIES = [
+    {
+        "name": "content_hash",
+        "dataType": ["string"],
+        "description": "Hash of the normalized chunk text and embedding model"
+    },
+    {
+        "name": "content_length",
+        "dataType": ["int"],
+        "description": "Length of the chunk text in characters"
+    }
+]
+
 class WeaviateClient:
     def __init__(self):
         self.client = None
+        self.async_client = None
         self.class_name = "DocumentChunk"
+        # Bumped on every write so caches built on search results can
+        # invalidate; shared through a file so every worker sees every write
+        self._corpus_version = SharedCounter(settings.CORPUS_VERSION_PATH)
+        # client.batch is shared state; writers take turns, each using the
+        # batch's own worker threads
+        self._batch_lock = threading.Lock()
+        # Separate from _batch_lock so stats never wait for a batch in flight
+        self._totals_lock = threading.Lock()
+        self._write_totals = {"objects": 0, "failed": 0, "bytes": 0, "seconds": 0.0}
         self._connect()
         self._create_schema()
     
@@ -19,15 +55,51 @@ class WeaviateClient:
                 url=settings.WEAVIATE_URL,
                 timeout_config=(5, 15)
             )
+            # Async client used by the query path; speaks GraphQL directly so
+            # searches never block the event loop
+            self.async_client = httpx.AsyncClient(
+                base_url=settings.WEAVIATE_URL,
+                timeout=httpx.Timeout(15.0, connect=5.0),
+                limits=httpx.Limits(max_connections=settings.WEAVIATE_MAX_CONNECTIONS)
+            )
             logger.info(f"Connected to Weaviate at {settings.WEAVIATE_URL}")
         except Exception as e:
             logger.error(f"Failed to connect to Weaviate: {e}")
             raise
     
+    @property
+    def corpus_version(self) -> int:
+        """Number of corpus writes so far, across all workers"""
+        return self._corpus_version.value
+    
+    async def close(self):
+        """Close the async HTTP client"""
+        if self.async_client is not None:
+            await self.async_client.aclose()
+    
+    async def is_ready(self, timeout: float) -> bool:
+        """Probe Weaviate's readiness endpoint without touching the schema"""
+        try:
+            response = await self.async_client.get("/v1/.well-known/ready", timeout=timeout)
+            return response.status_code == 200
+        except Exception as e:
+            logger.error(f"Weaviate readiness probe failed: {e}")
+            return False
+    
+    async def _graphql(self, query: str) -> Dict[str, Any]:
+        """Run a GraphQL query against Weaviate asynchronously"""
+        response = await self.async_client.post("/v1/graphql", json={"query": query})
+        response.raise_for_status()
+        result = response.json()
+        if result.get("errors"):
+            raise RuntimeError(f"Weaviate GraphQL error: {result['errors']}")
+        return result
+    
     def _create_schema(self):
         """Create the document chunk schema in Weaviate"""
         if self.client.schema.exists(self.class_name):
             logger.info(f"Schema {self.class_name} already exists")
+            self._ensure_added_properties()
             return
         
         schema = {
@@ -59,7 +131,8 @@ class WeaviateClient:
                     "name": "metadata",
                     "dataType": ["text"],
                     "description": "Additional metadata about the chunk (JSON string)"
-                }
+                },
+                *ADDED_PROPERTIES
             ]
         }
         
@@ -70,113 +143,402 @@ class WeaviateClient:
             logger.error(f"Failed to create schema: {e}")
             raise
     
-    def add_documents(self, chunks: List[Dict[str, Any]]) -> bool:
-        """Add document chunks to Weaviate"""
+    def _ensure_added_properties(self):
+        """Add properties introduced after the schema was first created"""
         try:
-            with self.client.batch as batch:
-                for chunk in chunks:
-                    batch.add_data_object(
-                        data_object={
+            schema = self.client.schema.get(self.class_name)
+            existing = {p["name"] for p in schema.get("properties", [])}
+            for prop in ADDED_PROPERTIES:
+                if prop["name"] not in existing:
+                    self.client.schema.property.create(self.class_name, prop)
+                    logger.info(f"Added {prop['name']} property to {self.class_name}")
+        except Exception as e:
+            logger.error(f"Failed to migrate schema {self.class_name}: {e}")
+    
+    def add_documents(self, chunks: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Add document chunks to Weaviate, upserting by chunk ID
+        
+        Returns how many chunks were stored, the per-object errors keyed by
+        chunk ID and the write throughput.
+        """
+        errors: Dict[str, str] = {}
+        
+        def collect(results: Optional[List[Dict[str, Any]]]):
+            # Called once per flushed batch, after Weaviate-error retries
+            for item in results or []:
+                item_errors = (item.get("result") or {}).get("errors")
+                if item_errors:
+                    errors[item["id"]] = "; ".join(e.get("message", str(e)) for e in item_errors.get("error", []))
+                else:
+                    errors.pop(item["id"], None)
+        
+        payload_bytes = 0
+        start = time.perf_counter()
+        try:
+            with self._batch_lock:
+                self.client.batch.configure(
+                    batch_size=settings.WEAVIATE_BATCH_SIZE,
+                    dynamic=settings.WEAVIATE_BATCH_DYNAMIC,
+                    num_workers=settings.WEAVIATE_BATCH_WORKERS,
+                    timeout_retries=settings.WEAVIATE_BATCH_RETRIES,
+                    connection_error_retries=settings.WEAVIATE_BATCH_RETRIES,
+                    weaviate_error_retries=weaviate.WeaviateErrorRetryConf(
+                        number_retries=settings.WEAVIATE_BATCH_RETRIES
+                    ),
+                    callback=collect
+                )
+                with self.client.batch as batch:
+                    for chunk in chunks:
+                        data_object = {
                             "content": chunk["content"],
                             "document_id": chunk["document_id"],
                             "filename": chunk["filename"],
                             "chunk_index": chunk["chunk_index"],
-                            "metadata": chunk["metadata"]
-                        },
-                        class_name=self.class_name,
-                        vector=chunk["vector"]
-                    )
-            logger.info(f"Added {len(chunks)} chunks to Weaviate")
-            return True
+                            "metadata": chunk["metadata"],
+                            "content_hash": chunk["content_hash"],
+                            "content_length": len(chunk["content"])
+                        }
+                        payload_bytes += len(json.dumps(data_object, default=str)) + len(json.dumps(chunk["vector"]))
+                        batch.add_data_object(
+                            data_object=data_object,
+                            class_name=self.class_name,
+                            uuid=chunk["chunk_id"],
+                            vector=chunk["vector"]
+                        )
         except Exception as e:
             logger.error(f"Failed to add documents: {e}")
-            return False
+            # Unknown which objects landed; report every unconfirmed one as failed
+            for chunk in chunks:
+                errors.setdefault(chunk["chunk_id"], str(e))
+        finally:
+            # Partial batches may still have landed
+            self._corpus_version.increment()
+        
+        seconds = time.perf_counter() - start
+        stored = len(chunks) - len(errors)
+        self._record_write(stored, len(errors), payload_bytes, seconds)
+        
+        result = {
+            "stored": stored,
+            "errors": errors,
+            "seconds": seconds,
+            "bytes": payload_bytes,
+            "objects_per_second": stored / seconds if seconds else 0.0,
+            "bytes_per_second": payload_bytes / seconds if seconds else 0.0
+        }
+        if errors:
+            logger.error(f"Failed to add {len(errors)}/{len(chunks)} chunks; first error: {next(iter(errors.values()))}")
+        logger.info(
+            f"Added {stored} chunks to Weaviate in {seconds:.2f}s "
+            f"({result['objects_per_second']:.0f} objects/s, {result['bytes_per_second'] / 1024:.0f} KB/s)"
+        )
+        return result
     
-    def search_similar(self, query_vector: List[float], limit: int = 5) -> List[Dict[str, Any]]:
-        """Search for similar chunks using vector similarity"""
-        try:
-            result = (
-                self.client.query
-                .get(self.class_name, ["content", "document_id", "filename", "chunk_index", "metadata"])
-                .with_near_vector({"vector": query_vector})
-                .with_limit(limit)
-                .do()
+    def write_stats(self) -> Dict[str, Any]:
+        """Return cumulative batch write counters and throughput"""
+        with self._totals_lock:
+            totals = dict(self._write_totals)
+        seconds = totals["seconds"]
+        return {
+            **totals,
+            "objects_per_second": totals["objects"] / seconds if seconds else 0.0,
+            "bytes_per_second": totals["bytes"] / seconds if seconds else 0.0
+        }
+    
+    def _record_write(self, stored: int, failed: int, payload_bytes: int, seconds: float):
+        with self._totals_lock:
+            self._write_totals["objects"] += stored
+            self._write_totals["failed"] += failed
+            self._write_totals["bytes"] += payload_bytes
+            self._write_totals["seconds"] += seconds
+    
+    async def search_similar(self, query_vector: List[float], limit: int = 5,
+                             max_distance: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Search for similar chunks using vector similarity
+        
+        With ``max_distance`` Weaviate drops farther chunks server-side.
+        """
+        near_vector = {"vector": query_vector}
+        if max_distance is not None:
+            near_vector["distance"] = max_distance
+        query = (
+            self.client.query
+            .get(self.class_name, CHUNK_PROPERTIES)
+            .with_near_vector(near_vector)
+            .with_additional(["id", "distance", "certainty"])
+            .with_limit(limit)
+        )
+        return await self._search(query, "similar")
+    
+    async def search_hybrid(self, query_text: str, query_vector: List[float], limit: int = 5,
+                            alpha: float = 0.5, max_distance: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Search with Weaviate hybrid fusion of BM25 and vector similarity
+        
+        ``alpha`` weighs the vector side: 1 is pure vector, 0 pure BM25.
+        With ``max_distance`` chunks whose cosine distance to ``query_vector``
+        exceeds it are dropped; hybrid results carry no distance, so it is
+        computed from the returned object vectors.
+        """
+        query = (
+            self.client.query
+            .get(self.class_name, CHUNK_PROPERTIES)
+            .with_hybrid(
+                query_text,
+                alpha=alpha,
+                vector=query_vector,
+                properties=["content"],
+                fusion_type=HybridFusion.RELATIVE_SCORE
             )
+            .with_additional(["id", "score", "vector"] if max_distance is not None else ["id", "score"])
+            .with_limit(limit)
+        )
+        chunks = await self._search(query, "hybrid")
+        if max_distance is None:
+            return chunks
+        return self._within_distance(chunks, query_vector, max_distance)
+    
+    async def search_keyword(self, query_text: str, limit: int = 5, query_vector: Optional[List[float]] = None,
+                             max_distance: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Search chunk content with BM25 only
+        
+        With ``max_distance`` chunks whose cosine distance to ``query_vector``
+        exceeds it are dropped, computed from the returned object vectors as
+        in search_hybrid.
+        """
+        query = (
+            self.client.query
+            .get(self.class_name, CHUNK_PROPERTIES)
+            .with_bm25(query_text, properties=["content"])
+            .with_additional(["id", "score", "vector"] if max_distance is not None else ["id", "score"])
+            .with_limit(limit)
+        )
+        chunks = await self._search(query, "keyword")
+        if max_distance is None:
+            return chunks
+        return self._within_distance(chunks, query_vector, max_distance)
+    
+    def _within_distance(self, chunks: List[Dict[str, Any]], query_vector: List[float],
+                         max_distance: float) -> List[Dict[str, Any]]:
+        """Set each chunk's cosine distance from its vector and keep those within ``max_distance``"""
+        query_array = np.asarray(query_vector, dtype=np.float32)
+        query_norm = np.linalg.norm(query_array)
+        kept = []
+        for chunk in chunks:
+            vector = np.asarray(chunk.pop("vector"), dtype=np.float32)
+            norms = query_norm * np.linalg.norm(vector)
+            chunk["distance"] = float(1.0 - query_array @ vector / norms) if norms else 1.0
+            if chunk["distance"] <= max_distance:
+                kept.append(chunk)
+        return kept
+    
+    async def _search(self, query: Any, kind: str) -> List[Dict[str, Any]]:
+        """Run a built Get query and normalize the returned chunks"""
+        try:
+            result = await self._graphql(query.build())
             
             chunks = []
             if "data" in result and "Get" in result["data"]:
                 for item in result["data"]["Get"][self.class_name]:
-                    chunks.append({
+                    additional = item.get("_additional") or {}
+                    chunk = {
+                        "chunk_id": additional.get("id"),
                         "content": item["content"],
                         "document_id": item["document_id"],
                         "filename": item["filename"],
                         "chunk_index": item["chunk_index"],
                         "metadata": item["metadata"],
-                        "distance": item.get("_additional", {}).get("distance", 0)
-                    })
+                        "distance": additional.get("distance") or 0
+                    }
+                    if additional.get("certainty") is not None:
+                        chunk["certainty"] = additional["certainty"]
+                    # Hybrid and BM25 scores come back as strings
+                    if additional.get("score") is not None:
+                        chunk["score"] = float(additional["score"])
+                    if additional.get("vector") is not None:
+                        chunk["vector"] = additional["vector"]
+                    chunks.append(chunk)
             
-            logger.info(f"Found {len(chunks)} similar chunks")
+            logger.info(f"Found {len(chunks)} {kind} chunks")
             return chunks
         except Exception as e:
-            logger.error(f"Failed to search similar documents: {e}")
+            logger.error(f"Failed to search {kind} documents: {e}")
             return []
     
     def get_document_chunks(self, document_id: str) -> List[Dict[str, Any]]:
         """Get all chunks for a specific document"""
         try:
-            result = (
-                self.client.query
-                .get(self.class_name, ["content", "document_id", "filename", "chunk_index", "metadata"])
-                .with_where({
-                    "path": ["document_id"],
-                    "operator": "Equal",
-                    "valueString": document_id
-                })
-                .do()
-            )
-            
-            chunks = []
-            if "data" in result and "Get" in result["data"]:
-                for item in result["data"]["Get"][self.class_name]:
-                    chunks.append({
-                        "content": item["content"],
-                        "document_id": item["document_id"],
-                        "filename": item["filename"],
-                        "chunk_index": item["chunk_index"],
-                        "metadata": item["metadata"]
-                    })
-            
-            return chunks
+            return list(self.iter_document_chunks(document_id))
         except Exception as e:
             logger.error(f"Failed to get document chunks: {e}")
             return []
     
-    def delete_document(self, document_id: str) -> bool:
-        """Delete all chunks for a specific document"""
-        try:
-            result = (
-                self.client.query
-                .get(self.class_name, ["id"])
-                .with_where({
-                    "path": ["document_id"],
-                    "operator": "Equal",
-                    "valueString": document_id
-                })
-                .do()
-            )
+    def iter_document_chunks(self, document_id: str, properties: Optional[List[str]] = None,
+                             page_size: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Yield a document's chunks in chunk_index order, one page at a time
+        
+        Weaviate's cursor API does not combine with filters, so pages are
+        keyed on chunk_index. Pages restart at the last index seen and skip
+        IDs already yielded, so chunks briefly sharing an index during a
+        re-ingest are not lost.
+        """
+        properties = properties or CHUNK_PROPERTIES
+        page_size = page_size or settings.WEAVIATE_PAGE_SIZE
+        last_index, last_ids = -1, set()
+        
+        while True:
+            items = self._get_page(document_id, properties, last_index, page_size)
+            fresh = [
+                item for item in items
+                if not (item["chunk_index"] == last_index and item["_additional"]["id"] in last_ids)
+            ]
+            if not fresh:
+                if len(items) == page_size:
+                    # A full page of already-seen ties: paging could not advance
+                    raise RuntimeError(f"More than {page_size} chunks share chunk_index {last_index}")
+                return
             
-            if "data" in result and "Get" in result["data"]:
-                for item in result["data"]["Get"][self.class_name]:
-                    self.client.data_object.delete(
-                        uuid=item["id"],
-                        class_name=self.class_name
-                    )
+            for item in fresh:
+                chunk = {key: item[key] for key in properties}
+                chunk["chunk_id"] = item["_additional"]["id"]
+                yield chunk
             
-            logger.info(f"Deleted document {document_id}")
-            return True
+            page_last = items[-1]["chunk_index"]
+            if page_last != last_index:
+                last_index, last_ids = page_last, set()
+            last_ids.update(item["_additional"]["id"] for item in items if item["chunk_index"] == page_last)
+            if len(items) < page_size:
+                return
+    
+    def _get_page(self, document_id: str, properties: List[str], from_index: int,
+                  page_size: int) -> List[Dict[str, Any]]:
+        result = (
+            self.client.query
+            .get(self.class_name, list(dict.fromkeys([*properties, "chunk_index"])))
+            .with_additional(["id"])
+            .with_where({
+                "operator": "And",
+                "operands": [
+                    {"path": ["document_id"], "operator": "Equal", "valueString": document_id},
+                    {"path": ["chunk_index"], "operator": "GreaterThanEqual", "valueInt": from_index}
+                ]
+            })
+            .with_sort({"path": ["chunk_index"], "order": "asc"})
+            .with_limit(page_size)
+            .do()
+        )
+        if result.get("errors"):
+            raise RuntimeError(f"Weaviate GraphQL error: {result['errors']}")
+        return result.get("data", {}).get("Get", {}).get(self.class_name) or []
+    
+    def get_chunk_indexes(self, document_id: str) -> Dict[str, int]:
+        """Map the IDs of a document's stored chunks to their chunk_index"""
+        return {
+            chunk["chunk_id"]: chunk["chunk_index"]
+            for chunk in self.iter_document_chunks(document_id, properties=["chunk_index"])
+        }
+    
+    def set_chunk_indexes(self, indexes: Dict[str, int]):
+        """Give stored chunks new chunk_index values, keeping their content and vectors"""
+        try:
+            for chunk_id, chunk_index in indexes.items():
+                self.client.data_object.update(
+                    data_object={"chunk_index": chunk_index},
+                    class_name=self.class_name,
+                    uuid=chunk_id
+                )
+        finally:
+            self._corpus_version.increment()
+    
+    def get_document_stats(self, document_id: str) -> Dict[str, Any]:
+        """Count a document's chunks and sum their lengths with one aggregate query
+        
+        Chunks stored before content_length was added lack it; when the
+        aggregate counts fewer lengths than chunks, their content is paged
+        through and measured instead.
+        """
+        result = (
+            self.client.query
+            .aggregate(self.class_name)
+            .with_where({
+                "path": ["document_id"],
+                "operator": "Equal",
+                "valueString": document_id
+            })
+            .with_meta_count()
+            .with_fields("content_length { sum count } filename { topOccurrences(limit: 1) { value } }")
+            .do()
+        )
+        if result.get("errors"):
+            raise RuntimeError(f"Weaviate GraphQL error: {result['errors']}")
+        
+        groups = result["data"]["Aggregate"][self.class_name]
+        if not groups:
+            return {"total_chunks": 0, "total_content_length": 0, "filename": None}
+        group = groups[0]
+        top_filenames = group["filename"]["topOccurrences"] or [{}]
+        total_content_length = int(group["content_length"]["sum"] or 0)
+        if (group["content_length"]["count"] or 0) < group["meta"]["count"]:
+            total_content_length += sum(
+                len(chunk["content"])
+                for chunk in self.iter_document_chunks(document_id, ["content", "content_length"])
+                if chunk["content_length"] is None
+            )
+        return {
+            "total_chunks": group["meta"]["count"],
+            "total_content_length": total_content_length,
+            "filename": top_filenames[0].get("value")
+        }
+    
+    def delete_chunks(self, chunk_ids: List[str]) -> int:
+        """Delete chunks by ID and return how many were removed"""
+        try:
+            deleted = 0
+            for start in range(0, len(chunk_ids), MAX_QUERY_RESULTS):
+                deleted += self._batch_delete({
+                    "path": ["id"],
+                    "operator": "ContainsAny",
+                    "valueTextArray": chunk_ids[start:start + MAX_QUERY_RESULTS]
+                })
+            if deleted:
+                logger.info(f"Deleted {deleted} chunks")
+            return deleted
+        finally:
+            self._corpus_version.increment()
+    
+    def delete_document(self, document_id: str) -> Optional[int]:
+        """Delete all chunks for a specific document
+        
+        Returns the number of chunks removed, or None if the delete failed.
+        """
+        try:
+            deleted = self._batch_delete({
+                "path": ["document_id"],
+                "operator": "Equal",
+                "valueString": document_id
+            })
+            logger.info(f"Deleted document {document_id} ({deleted} chunks)")
+            return deleted
         except Exception as e:
             logger.error(f"Failed to delete document: {e}")
-            return False
+            return None
+        finally:
+            self._corpus_version.increment()
+    
+    def _batch_delete(self, where: Dict[str, Any]) -> int:
+        """Delete every object matching a filter with server-side batch deletes"""
+        deleted = 0
+        while True:
+            result = self.client.batch.delete_objects(
+                class_name=self.class_name,
+                where=where,
+                output="minimal"
+            )["results"]
+            if result["failed"]:
+                raise RuntimeError(f"Batch delete failed for {result['failed']} of {result['matches']} objects")
+            deleted += result["successful"]
+            # A single call removes at most QUERY_MAXIMUM_RESULTS objects
+            if result["matches"] < result["limit"] or not result["successful"]:
+                return deleted
     
     def get_stats(self) -> Dict[str, Any]:
         """Get statistics about the vector store"""
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Verificación y benchmark del chunker
+Compara el chunker por generadores (app/services/chunking.py) contra la
+implementación original por concatenación de strings:
+- Propiedades: mismos chunks para textos, tamaños y bloques aleatorios
+- Rendimiento: tiempo sobre un texto sintético grande (50 MB por defecto)
+"""
+
+import re
+import sys
+import time
+import random
+import tracemalloc
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from app.services import chunking
+
+WORDS = ["paciente", "dosis", "mg", "insulina", "metformina", "glucosa", "hepática",
+         "ñandú", "Dr", "a.m", "...", ".", "!", "?", "¿", "  ", "\n", "x"]
+
+
+def legacy_chunks(text, chunk_size, chunk_overlap):
+    """Implementación original de DocumentProcessor._chunk_text (solo contenido)"""
+    sentences = [s.strip() for s in re.split(r'[.!?]+', text) if s.strip()]
+    chunks = []
+    current_chunk = ""
+    for sentence in sentences:
+        if len(current_chunk) + len(sentence) > chunk_size and current_chunk:
+            chunks.append(current_chunk.strip())
+            if len(current_chunk) <= chunk_overlap:
+                overlap_text = current_chunk
+            else:
+                overlap_text = current_chunk[-chunk_overlap:].strip()
+            current_chunk = overlap_text + " " + sentence
+        else:
+            current_chunk += " " + sentence if current_chunk else sentence
+    if current_chunk.strip():
+        chunks.append(current_chunk.strip())
+    return chunks
+
+
+def random_text(rng, words):
+    return "".join(rng.choice(WORDS) + rng.choice([" ", "", "\n", ". "]) for _ in range(words))
+
+
+def blocks_of(text, size):
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+
+def check_properties(cases, seed):
+    """Compara ambas implementaciones sobre casos aleatorios"""
+    rng = random.Random(seed)
+    for case in range(cases):
+        text = random_text(rng, rng.randint(0, 2000))
+        chunk_size = rng.randint(1, 400)
+        chunk_overlap = rng.randint(0, 120)
+        expected = legacy_chunks(text, chunk_size, chunk_overlap)
+
+        whole = list(chunking.iter_chunks(chunking.iter_sentences(text), chunk_size, chunk_overlap))
+        streamed = list(chunking.iter_chunks(
+            chunking.iter_block_sentences(blocks_of(text, rng.randint(1, 64))),
+            chunk_size, chunk_overlap
+        ))
+        if whole != expected or streamed != expected:
+            print(f"❌ Caso {case}: chunk_size={chunk_size} chunk_overlap={chunk_overlap}")
+            return False
+    print(f"✅ {cases} casos aleatorios producen los mismos chunks")
+    return True
+
+
+def benchmark(size_mb, chunk_size, chunk_overlap, seed):
+    """Mide ambas implementaciones sobre un texto sintético grande"""
+    rng = random.Random(seed)
+    sentence_pool = [
+        " ".join(rng.choice(WORDS[:8]) for _ in range(rng.randint(3, 30))) + rng.choice([". ", "! ", "? "])
+        for _ in range(1000)
+    ]
+    target = size_mb * 1024 * 1024
+    parts, length = [], 0
+    while length < target:
+        sentence = rng.choice(sentence_pool)
+        parts.append(sentence)
+        length += len(sentence)
+    text = "".join(parts)
+    print(f"📄 Texto sintético: {len(text) / (1024 * 1024):.1f} MB")
+
+    start = time.perf_counter()
+    expected = legacy_chunks(text, chunk_size, chunk_overlap)
+    legacy_time = time.perf_counter() - start
+    print(f"🐢 Original: {legacy_time:.2f}s ({len(expected)} chunks)")
+
+    start = time.perf_counter()
+    produced = 0
+    for produced, chunk in enumerate(chunking.iter_chunks(chunking.iter_sentences(text), chunk_size, chunk_overlap), 1):
+        if chunk != expected[produced - 1]:
+            print(f"❌ El chunk {produced - 1} difiere")
+            return False
+    generator_time = time.perf_counter() - start
+    print(f"🚀 Generador: {generator_time:.2f}s ({produced} chunks)")
+    print(f"📈 Speedup: {legacy_time / generator_time:.2f}x")
+    if produced != len(expected):
+        return False
+    del expected
+
+    # Memoria pico adicional al texto: la lista de oraciones y de chunks
+    # frente a consumir el generador chunk por chunk
+    tracemalloc.start()
+    legacy_chunks(text, chunk_size, chunk_overlap)
+    legacy_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    for _ in chunking.iter_chunks(chunking.iter_sentences(text), chunk_size, chunk_overlap):
+        pass
+    generator_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"🧠 Memoria pico: original {legacy_peak / (1024 * 1024):.1f} MB, "
+          f"generador {generator_peak / (1024 * 1024):.2f} MB")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificación y benchmark del chunker")
+    parser.add_argument("--cases", type=int, default=2000, help="Casos aleatorios a verificar")
+    parser.add_argument("--mb", type=int, default=50, help="Tamaño del texto del benchmark")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if not check_properties(args.cases, args.seed):
+        return 1
+    if not benchmark(args.mb, args.chunk_size, args.chunk_overlap, args.seed):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark de extracción de texto PDF
+Compara la extracción serial (una página tras otra en el hilo actual) contra
+la extracción por rangos de páginas en un pool de procesos
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from app.services import extraction
+
+LINE = "Paracetamol 500 mg cada 6 a 8 horas. Dosis maxima 4 g al dia. Vigilar funcion hepatica."
+
+
+def build_synthetic_pdf(path: str, pages: int, lines_per_page: int = 40):
+    """Genera un PDF de texto plano con el número de páginas indicado"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Pages, se completa al final
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(pages):
+        text_ops = ["BT", "/F1 10 Tf", "12 TL", "40 800 Td"]
+        for line in range(lines_per_page):
+            text_ops.append(f"(Pagina {page + 1} linea {line + 1}: {LINE}) Tj T*")
+        text_ops.append("ET")
+        stream = "\n".join(text_ops).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % pages
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def extract_serial(path: str) -> str:
+    """Extracción original: todas las páginas en el hilo actual"""
+    pages = extraction.extract_pdf_pages(path, 0, extraction.count_pdf_pages(path))
+    return "".join(page + "\n" for page in pages).strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de extracción PDF")
+    parser.add_argument("--pages", type=int, default=400, help="Páginas del PDF sintético")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--pages-per-shard", type=int, default=25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sintetico.pdf")
+        build_synthetic_pdf(path, args.pages)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"📄 PDF sintético: {args.pages} páginas, {size_mb:.1f} MB")
+
+        start = time.perf_counter()
+        serial_text = extract_serial(path)
+        serial_time = time.perf_counter() - start
+        print(f"🐢 Serial: {serial_time:.2f}s")
+
+        with ProcessPoolExecutor(max_workers=args.workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            # Calentar el pool para no medir el arranque de procesos
+            list(pool.map(abs, range(args.workers)))
+
+            start = time.perf_counter()
+            parallel_text = extraction.extract_pdf_text(pool, path, args.pages_per_shard)
+            parallel_time = time.perf_counter() - start
+
+        print(f"🚀 Pool ({args.workers} workers, {args.pages_per_shard} páginas/shard): {parallel_time:.2f}s")
+        print(f"📈 Speedup: {serial_time / parallel_time:.2f}x")
+
+        if parallel_text != serial_text:
+            print("❌ El texto extraído en paralelo no coincide con el serial")
+            return 1
+        print("✅ El texto coincide y respeta el orden de páginas")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Verifica que SaptivaLLMClient reutiliza conexiones HTTP
+Lanza el servidor mock local y compara conexiones TCP contra requests
+"""
+
+import os
+import sys
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from mock_saptiva_server import MockSaptivaServer
+
+
+async def run_queries(llm_client, total: int, concurrency: int):
+    """Ejecuta consultas contra el mock con concurrencia acotada"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            return await llm_client.generate_response(f"Pregunta {i}")
+
+    await llm_client.start()
+    try:
+        return await asyncio.gather(*(one(i) for i in range(total)))
+    finally:
+        await llm_client.close()
+
+
+def main():
+    total = int(os.getenv("POOLING_REQUESTS", "50"))
+    concurrency = int(os.getenv("POOLING_CONCURRENCY", "5"))
+
+    server = MockSaptivaServer()
+    server.start_background()
+
+    # Settings are read at import time, so point the client at the mock first
+    os.environ["SAPTIVA_API_URL"] = server.url
+    os.environ.setdefault("SAPTIVA_API_KEY", "mock-key")
+    from app.services.llm import llm_client
+
+    print(f"🚀 Enviando {total} requests con concurrencia {concurrency} a {server.url}")
+    answers = asyncio.run(run_queries(llm_client, total, concurrency))
+    stats = server.stats()
+    server.shutdown()
+
+    print(f"   Respuestas válidas: {sum(1 for a in answers if a)}/{total}")
+    print(f"   Requests recibidos: {stats['requests']}")
+    print(f"   Conexiones TCP abiertas: {stats['connections']}")
+
+    if stats["connections"] <= concurrency and stats["requests"] == total:
+        print("✅ El cliente reutiliza conexiones (keep-alive)")
+        return 0
+
+    print("❌ Se abrieron más conexiones de las esperadas")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Verifica reintentos, timeouts y circuit breaker de SaptivaLLMClient
+Lanza el servidor mock local con inyección de fallas y comprueba:
+- Fallas transitorias (503 + Retry-After, conexión cortada) se reintentan
+- Un Retry-After demasiado largo no se espera
+- Una respuesta lenta corta por timeout de lectura, no a los 30 s
+- Un stream cortado a mitad de la respuesta se reporta como truncado
+  y la respuesta parcial nunca entra al caché de respuestas
+- Con el proveedor caído el circuito se abre y las llamadas fallan rápido
+- Tras el enfriamiento una llamada de prueba cierra el circuito
+
+El escenario del stream cortado pasa por el pipeline RAG, que se conecta
+a Weaviate al importarse: requiere WEAVIATE_URL accesible, aunque la
+recuperación se sustituye por un fragmento fijo.
+"""
+
+import os
+import sys
+import time
+import asyncio
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from mock_saptiva_server import MockSaptivaServer
+
+READ_TIMEOUT = 0.5
+COOLDOWN = 1.0
+
+
+async def scenario(server, llm_client, name, faults, calls=1, stream=False, reset=True):
+    """Configura fallas, hace ``calls`` llamadas y reporta respuestas, requests y tiempo"""
+    server.configure_faults(**faults)
+    if reset:
+        # Cada escenario parte con el circuito cerrado salvo los que lo prueban
+        llm_client.breaker.reset()
+    before = server.stats()["requests"]
+    start = time.perf_counter()
+    answers = []
+    for i in range(calls):
+        if stream:
+            answers.append("".join([t async for t in llm_client.stream_response(f"Pregunta {i}")]) or None)
+        else:
+            answers.append(await llm_client.generate_response(f"Pregunta {i}"))
+    elapsed = time.perf_counter() - start
+    requests = server.stats()["requests"] - before
+    ok = sum(1 for answer in answers if answer)
+    print(f"   {name}: {ok}/{calls} respuestas, {requests} requests, {elapsed:.2f}s, "
+          f"circuito {llm_client.breaker.state}")
+    return ok, requests, elapsed
+
+
+async def cut_stream_scenario(server, rag_pipeline, answer_cache):
+    """Consulta en streaming con el stream cortado a mitad; devuelve el texto
+    recibido, el evento final y si la respuesta quedó en el caché
+
+    La recuperación y el embedding de la pregunta se sustituyen por un
+    fragmento fijo, así solo el LLM decide el resultado.
+    """
+    chunk = {"content": "La metformina es el tratamiento inicial de la diabetes tipo 2.",
+             "document_id": "mock", "filename": "mock.txt", "chunk_index": 0, "score": 1.0}
+
+    async def lookup_cache(question, variant, corpus_version):
+        return None, [1.0] + [0.0] * 383
+
+    async def retrieve(*args, **kwargs):
+        return [chunk]
+
+    rag_pipeline._lookup_cache = lookup_cache
+    rag_pipeline._retrieve = retrieve
+
+    server.configure_faults(fail_next=1, fail_mode="cut")
+    before = answer_cache.stats()["entries"]
+    events = [event async for event in rag_pipeline.query_stream("¿Tratamiento inicial de la diabetes?")]
+    tokens = "".join(event["data"]["text"] for event in events if event["event"] == "token")
+    cached = answer_cache.stats()["entries"] > before
+    print(f"   stream cortado: {len(tokens)} caracteres recibidos, final {events[-1]}, "
+          f"{'en caché' if cached else 'fuera del caché'}")
+    return tokens, events[-1], cached
+
+
+async def run_checks(server, llm_client, rag_pipeline, answer_cache):
+    """Ejecuta los escenarios y devuelve la lista de verificaciones fallidas"""
+    failures = []
+
+    def check(condition, message):
+        print(f"   {'✅' if condition else '❌'} {message}")
+        if not condition:
+            failures.append(message)
+
+    await llm_client.start()
+    try:
+        ok, requests, _ = await scenario(server, llm_client, "503 transitorio",
+                                         {"fail_next": 2, "retry_after": "0"})
+        check(ok == 1 and requests == 3, "Dos 503 con Retry-After se reintentan y la tercera responde")
+
+        ok, requests, _ = await scenario(server, llm_client, "conexión cortada",
+                                         {"fail_next": 1, "fail_mode": "drop"})
+        check(ok == 1 and requests == 2, "Una conexión cortada se reintenta")
+
+        ok, requests, _ = await scenario(server, llm_client, "streaming con 502",
+                                         {"fail_next": 1, "fail_status": 502}, stream=True)
+        check(ok == 1 and requests == 2, "El stream se reintenta antes del primer token")
+
+        ok, requests, elapsed = await scenario(server, llm_client, "429 con Retry-After largo",
+                                               {"fail_next": 1, "fail_status": 429, "retry_after": "120"})
+        check(ok == 0 and requests == 1 and elapsed < 1, "Un Retry-After mayor a LLM_RETRY_AFTER_MAX no se espera")
+
+        ok, requests, elapsed = await scenario(server, llm_client, "respuesta lenta",
+                                               {"response_delay": READ_TIMEOUT * 3})
+        check(ok == 0 and requests == 3 and elapsed < 10, "El timeout de lectura corta cada intento")
+
+        llm_client.breaker.reset()
+        tokens, done, cached = await cut_stream_scenario(server, rag_pipeline, answer_cache)
+        check(tokens and done["event"] == "done" and done["data"].get("truncated"),
+              "Un stream cortado a mitad termina marcado como truncado")
+        check(not cached, "La respuesta cortada nunca se guarda en el caché")
+        check(llm_client.breaker.stats()["recent_failure_rate"] > 0, "El corte cuenta como falla en el circuito")
+
+        ok, requests, elapsed = await scenario(server, llm_client, "proveedor caído",
+                                               {"fail_rate": 1.0, "retry_after": "0"}, calls=10)
+        check(llm_client.breaker.state == "open", "El circuito se abre con la tasa de errores alta")
+        check(requests < 10 * 3, "Con el circuito abierto no se llama al proveedor")
+
+        ok, requests, elapsed = await scenario(server, llm_client, "circuito abierto", {}, calls=5, reset=False)
+        check(ok == 0 and requests == 0 and elapsed < 0.1, "Las llamadas fallan rápido sin tocar la red")
+
+        await asyncio.sleep(COOLDOWN)
+        ok, requests, _ = await scenario(server, llm_client, "recuperación", {}, calls=3, reset=False)
+        check(ok == 3 and llm_client.breaker.state == "closed", "Tras el enfriamiento el circuito se cierra")
+    finally:
+        await llm_client.close()
+
+    return failures
+
+
+def main():
+    server = MockSaptivaServer(token_delay=0.0)
+    server.start_background()
+
+    # Settings are read at import time, so configure the client first
+    os.environ["SAPTIVA_API_URL"] = server.url
+    os.environ.setdefault("SAPTIVA_API_KEY", "mock-key")
+    os.environ["LLM_READ_TIMEOUT"] = str(READ_TIMEOUT)
+    os.environ["LLM_BACKOFF_BASE"] = "0.05"
+    os.environ["LLM_BREAKER_COOLDOWN"] = str(COOLDOWN)
+    from app.services.llm import llm_client
+    from app.services.rag import rag_pipeline
+    from app.services.cache import answer_cache
+
+    print(f"🧪 Escenarios de falla contra {server.url}")
+    failures = asyncio.run(run_checks(server, llm_client, rag_pipeline, answer_cache))
+    server.shutdown()
+
+    if failures:
+        print(f"❌ {len(failures)} verificaciones fallaron")
+        return 1
+    print("✅ Reintentos, timeouts y circuit breaker funcionan")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,6 +8,16 @@ import os
 import time
 from pathlib import Path
 
+def wait_for_job(base_url, job_id, timeout=300):
+    """Espera a que termine un job de ingesta y devuelve su estado final"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = requests.get(f"{base_url}/documents/jobs/{job_id}").json()
+        if job.get('status') in ('completed', 'completed_with_errors', 'failed'):
+            return job
+        time.sleep(0.5)
+    return {'status': 'timeout', 'error': f'Job {job_id} no terminó en {timeout}s'}
+
 def load_test_documents(base_url="http://localhost:8000", docs_dir="test-documents"):
     """Carga todos los documentos de prueba"""
     
@@ -34,38 +44,42 @@ def load_test_documents(base_url="http://localhost:8000", docs_dir="test-documen
     loaded_documents = []
     failed_documents = []
     
-    for i, filename in enumerate(text_files, 1):
-        file_path = os.path.join(docs_dir, filename)
-        
-        print(f"\n{i}/{len(text_files)} Cargando: {filename}")
+    # Un solo request bulk: la API embebe los chunks de todos los documentos juntos
+    handles = [open(os.path.join(docs_dir, filename), 'rb') for filename in text_files]
+    try:
+        files = [('files', (filename, f, 'text/plain')) for filename, f in zip(text_files, handles)]
+        response = requests.post(f"{base_url}/documents/bulk", files=files)
+    except Exception as e:
+        print(f"   ❌ Error: {str(e)}")
+        response = None
+    finally:
+        for f in handles:
+            f.close()
+    
+    if response is not None and response.status_code == 202:
+        data = response.json()
+        print(f"   ⏳ Job {data.get('job_id')} en cola, esperando...")
+        job = wait_for_job(base_url, data.get('job_id'))
         
-        try:
-            with open(file_path, 'rb') as f:
-                files = {'file': (filename, f, 'text/plain')}
-                response = requests.post(f"{base_url}/documents/upload", files=files)
-            
-            if response.status_code == 200:
-                data = response.json()
-                document_id = data.get('document_id')
-                chunks = data.get('chunks_created', 0)
-                
+        for document in job.get('documents', []):
+            if document.get('status') == 'completed':
                 loaded_documents.append({
-                    'filename': filename,
-                    'document_id': document_id,
-                    'chunks': chunks
+                    'filename': document['filename'],
+                    'document_id': document['document_id'],
+                    'chunks': document['chunks_total']
                 })
-                
-                print(f"   ✅ Cargado exitosamente - ID: {document_id}, Chunks: {chunks}")
+                print(f"   ✅ {document['filename']} - ID: {document['document_id']}, Chunks: {document['chunks_total']}")
             else:
-                print(f"   ❌ Error - Status: {response.status_code}")
-                failed_documents.append(filename)
-                
-        except Exception as e:
-            print(f"   ❌ Error: {str(e)}")
-            failed_documents.append(filename)
+                print(f"   ❌ {document['filename']}: {document.get('error') or job.get('error')}")
+                failed_documents.append(document['filename'])
         
-        # Pausa entre cargas
-        time.sleep(1)
+        if job.get('status') == 'timeout':
+            print(f"   ❌ {job.get('error')}")
+            failed_documents.extend(text_files)
+    else:
+        if response is not None:
+            print(f"   ❌ Error - Status: {response.status_code}")
+        failed_documents.extend(text_files)
     
     # Resumen final
     print("\n" + "=" * 50)
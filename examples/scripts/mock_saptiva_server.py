@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Servidor mock de Saptiva OPS para pruebas locales
+Responde con el formato de chat completions (normal o streaming SSE)
+y cuenta conexiones TCP y requests. Puede inyectar fallas: respuestas
+429/5xx con Retry-After, conexiones cortadas, streams cortados a
+mitad de la respuesta y respuestas lentas
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockSaptivaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        """Silencia el log por request"""
+        pass
+
+    def do_GET(self):
+        """Expone los contadores del servidor en /stats"""
+        if self.path != "/stats":
+            self._send_json(404, {"error": "not found"})
+            return
+        self._send_json(200, self.server.stats())
+
+    def do_POST(self):
+        """Responde como el endpoint de chat de Saptiva OPS"""
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/faults":
+            self.server.configure_faults(**payload)
+            self._send_json(200, self.server.stats())
+            return
+        self.server.count_request()
+
+        fault = self.server.next_fault()
+        if fault == "drop":
+            # Cierra la conexión sin responder
+            self.close_connection = True
+            return
+        if fault == "status":
+            headers = {}
+            if self.server.retry_after is not None:
+                headers["Retry-After"] = str(self.server.retry_after)
+            self._send_json(self.server.fail_status, {"error": "falla inyectada"}, headers)
+            return
+        if self.server.response_delay:
+            time.sleep(self.server.response_delay)
+
+        question = payload.get("messages", [{}])[-1].get("content", "")
+        answer = f"Respuesta simulada ({len(question)} caracteres de prompt)"
+        if payload.get("stream"):
+            self._send_stream(answer, cut=fault == "cut")
+            return
+        self._send_json(200, {
+            "choices": [{"message": {"role": "assistant", "content": answer}}]
+        })
+
+    def _send_stream(self, answer, cut=False):
+        """Envía la respuesta palabra por palabra como eventos SSE; con ``cut``
+        corta la conexión a la mitad, sin [DONE]"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        words = answer.split(" ")
+        if cut:
+            words = words[:len(words) // 2]
+        for word in words:
+            event = {"choices": [{"delta": {"content": word + " "}}]}
+            self._write_chunk(f"data: {json.dumps(event)}\n\n")
+            time.sleep(self.server.token_delay)
+        if cut:
+            self.close_connection = True
+            return
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status_code, body, headers=None):
+        """Envía una respuesta JSON manteniendo la conexión abierta"""
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MockSaptivaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, token_delay: float = 0.05):
+        super().__init__((host, port), MockSaptivaHandler)
+        self.token_delay = token_delay
+        self._lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.faults_injected = 0
+        self.configure_faults()
+
+    def configure_faults(self, fail_next: int = 0, fail_rate: float = 0.0, fail_mode: str = "status",
+                         fail_status: int = 503, retry_after=None, response_delay: float = 0.0):
+        """Configura las fallas: las próximas ``fail_next`` requests fallan, y luego
+        una fracción ``fail_rate``; ``fail_mode`` es "status" (responde
+        ``fail_status``), "drop" (corta la conexión) o "cut" (los streams se
+        cortan a mitad de la respuesta)"""
+        with self._lock:
+            self.fail_next = fail_next
+            self.fail_rate = fail_rate
+            self.fail_mode = fail_mode
+            self.fail_status = fail_status
+            self.retry_after = retry_after
+            self.response_delay = response_delay
+
+    def next_fault(self):
+        """Decide si la request actual falla y cómo"""
+        with self._lock:
+            if self.fail_next > 0:
+                self.fail_next -= 1
+            elif random.random() >= self.fail_rate:
+                return None
+            self.faults_injected += 1
+            return self.fail_mode
+
+    def get_request(self):
+        """Cuenta cada conexión TCP aceptada"""
+        request = super().get_request()
+        with self._lock:
+            self.connections += 1
+        return request
+
+    def handle_error(self, request, client_address):
+        """Ignora clientes que cortan la conexión (p. ej. por timeout de lectura)"""
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def stats(self):
+        with self._lock:
+            return {"connections": self.connections, "requests": self.requests,
+                    "faults_injected": self.faults_injected}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/chat"
+
+    def start_background(self):
+        """Inicia el servidor en un hilo daemon"""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor mock de Saptiva OPS")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--token-delay", type=float, default=0.05,
+                        help="Segundos entre tokens en modo streaming")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="Fracción de requests que fallan")
+    parser.add_argument("--fail-mode", choices=["status", "drop", "cut"], default="status")
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--retry-after", help="Valor del header Retry-After en las fallas")
+    parser.add_argument("--response-delay", type=float, default=0.0,
+                        help="Segundos de espera antes de responder")
+    args = parser.parse_args()
+
+    server = MockSaptivaServer(args.host, args.port, args.token_delay)
+    server.configure_faults(fail_rate=args.fail_rate, fail_mode=args.fail_mode, fail_status=args.fail_status,
+                            retry_after=args.retry_after, response_delay=args.response_delay)
+    print(f"🧪 Mock de Saptiva OPS escuchando en {server.url}")
+    print(f"📊 Contadores en http://{args.host}:{args.port}/stats")
+    print(f"💥 Fallas configurables con POST http://{args.host}:{args.port}/faults")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Deteniendo servidor mock")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
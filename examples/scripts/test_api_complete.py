@@ -45,6 +45,16 @@ class MediCopilotTester:
             self.log_test("Health Check", False, f"Error: {str(e)}")
             return False
     
+    def wait_for_job(self, job_id: str, timeout: float = 300) -> Dict[str, Any]:
+        """Espera a que termine un job de ingesta y devuelve su estado final"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = self.session.get(f"{self.base_url}/documents/jobs/{job_id}").json()
+            if job.get('status') in ('completed', 'completed_with_errors', 'failed'):
+                return job
+            time.sleep(0.5)
+        return {'status': 'timeout', 'error': f'Job {job_id} did not finish in {timeout}s'}
+    
     def test_document_upload(self, document_path: str) -> str:
         """Test de carga de documento"""
         try:
@@ -56,12 +66,16 @@ class MediCopilotTester:
                 files = {'file': (os.path.basename(document_path), f, 'text/plain')}
                 response = self.session.post(f"{self.base_url}/documents/upload", files=files)
             
-            if response.status_code == 200:
+            if response.status_code == 202:
                 data = response.json()
                 document_id = data.get('document_id')
+                job = self.wait_for_job(data.get('job_id'))
+                if job.get('status') != 'completed':
+                    self.log_test("Document Upload", False, f"Ingestion failed: {job.get('error')}")
+                    return None
                 self.uploaded_documents.append(document_id)
                 self.log_test("Document Upload", True, 
-                            f"Uploaded {data.get('filename')} with {data.get('chunks_created')} chunks")
+                            f"Uploaded {data.get('filename')} with {job.get('chunks_stored')} chunks")
                 return document_id
             else:
                 self.log_test("Document Upload", False, f"Status code: {response.status_code}")
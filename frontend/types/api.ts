@@ -3,6 +3,10 @@
 export interface QueryRequest {
   question: string;
   max_results?: number;
+  search_mode?: 'vector' | 'hybrid' | 'keyword' | 'rrf';
+  alpha?: number;  // hybrid only: 1 = pure vector, 0 = pure BM25
+  min_similarity?: number;  // 0-1; weaker chunks never reach the LLM
+  priority?: 'interactive' | 'batch';
 }
 
 export interface QueryResponse {
@@ -10,8 +14,17 @@ export interface QueryResponse {
   sources: Source[];
   query: string;
   timestamp: string;
+  context_tokens?: number;
+  degraded?: boolean;  // LLM unavailable: sources only, no generated answer
 }
 
+// Server-Sent Events emitted by POST /query/stream
+export type QueryStreamEvent =
+  | { event: 'sources'; data: { sources: Source[]; query: string; context_tokens: number } }
+  | { event: 'token'; data: { text: string } }
+  | { event: 'done'; data: { query: string; degraded?: boolean; truncated?: boolean } }
+  | { event: 'error'; data: { detail: string; status?: number; retry_after?: number } };
+
 export interface Source {
   filename: string;
   chunk_index: number;
@@ -20,18 +33,51 @@ export interface Source {
   document_id: string;
 }
 
+// POST /documents/upload queues the document; poll GET /documents/jobs/{job_id}
 export interface DocumentUploadResponse {
+  job_id: string;
   document_id: string;
   filename: string;
-  chunks_created: number;
+  status: string;
   message: string;
 }
 
+export interface IngestionJobStatus {
+  job_id: string;
+  document_id: string;
+  filename: string;
+  status: 'queued' | 'processing' | 'completed' | 'completed_with_errors' | 'failed';
+  pages_extracted: number;
+  chunks_total: number;
+  chunks_truncated: number;  // chunks longer than the embedding model's token window
+  tokens_truncated: number;
+  chunks_cached: number;  // vectors reused from the on-disk embedding store
+  chunks_embedded: number;
+  chunks_stored: number;
+  chunks_failed: number;  // per-object write errors are listed on each document
+  write_objects_per_second: number;
+  write_bytes_per_second: number;
+  chunks_unchanged: number;  // already stored from a previous upload of the same filename
+  chunks_deleted: number;
+  error?: string | null;
+  created_at: string;
+  updated_at: string;
+}
+
 export interface HealthResponse {
   status: string;
   weaviate_status: string;
+  llm_status: string;
   api_status: string;
   timestamp: string;
+  checks: Record<string, HealthCheck>;
+}
+
+export interface HealthCheck {
+  status: 'ok' | 'error' | 'stale';
+  latency_ms: number;
+  checked_at: string;
+  age_seconds: number;
 }
 
 export interface DocumentStats {
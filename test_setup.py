@@ -41,6 +41,16 @@ def test_api_connection():
         print(f"❌ Cannot connect to API: {e}")
         return False
 
+def wait_for_job(job_id, timeout=120):
+    """Poll an ingestion job until it finishes"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = requests.get(f"http://localhost:8000/documents/jobs/{job_id}", timeout=5).json()
+        if job['status'] in ('completed', 'completed_with_errors', 'failed'):
+            return job
+        time.sleep(0.5)
+    return {'status': 'timeout', 'error': f'Job {job_id} did not finish in {timeout}s'}
+
 def test_document_upload():
     """Test document upload with a sample text file"""
     try:
@@ -75,11 +85,15 @@ def test_document_upload():
             files = {"file": ("test_document.txt", f, "text/plain")}
             response = requests.post("http://localhost:8000/documents/upload", files=files)
         
-        if response.status_code == 200:
+        if response.status_code == 202:
             data = response.json()
+            job = wait_for_job(data['job_id'])
+            if job['status'] != 'completed':
+                print(f"❌ Document ingestion failed: {job.get('error')}")
+                return None
             print(f"✅ Document uploaded successfully")
             print(f"   Document ID: {data['document_id']}")
-            print(f"   Chunks created: {data['chunks_created']}")
+            print(f"   Chunks created: {job['chunks_stored']}")
             return data['document_id']
         else:
             print(f"❌ Document upload failed: {response.status_code} - {response.text}")